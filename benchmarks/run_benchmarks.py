@@ -0,0 +1,415 @@
+"""
+Offline performance benchmarks for the chat server.
+
+Runs against the deterministic local models (MODEL_PROVIDER=fake), so results
+do not depend on OpenAI latency or cost anything, in a scratch working
+directory holding generated invoices, the index, caches and the database.
+
+    python benchmarks/run_benchmarks.py --documents 200 --concurrency 16 --output results.json
+
+Sections:
+    ingestion  documents through `pipeline` (parse, enrichment, embeddings), then the index build
+    load       opening the persisted index
+    retrieval  hybrid retrieval plus context packing per query
+    chat       /chat/sendMessage over real HTTP: time to first token and total time per request
+               under N concurrent SSE clients
+    startup    cold starts of a fresh server process: `import main`, then time until /health/live
+               and /health/ready answer 200, with the index already built and with none on disk
+
+The results are written as JSON, to stdout or to --output, so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECTIONS = ("ingestion", "load", "retrieval", "chat", "startup")
+
+VENDORS = ["Acme Corp", "Globex", "Initech", "Umbrella Supply", "Stark Industrial", "Wayne Logistics", "Hooli", "Vandelay Imports"]
+ITEMS = ["widgets", "consulting hours", "freight", "licenses", "maintenance", "cloud hosting", "office chairs", "toner"]
+QUESTIONS = [
+    "What is the total amount due on invoice {invoice}?",
+    "Which vendor issued invoice {invoice}?",
+    "When is payment due for the {vendor} invoice?",
+    "List the line items billed by {vendor}.",
+    "Are there compliance issues with invoice {invoice}?",
+    "How much did we pay {vendor} for {item}?",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="comma-separated subset of " + ", ".join(SECTIONS))
+    parser.add_argument("--documents", type=int, default=200, help="generated invoice files")
+    parser.add_argument("--line-items", type=int, default=12, help="line items per invoice")
+    parser.add_argument("--queries", type=int, default=200, help="retrieval queries")
+    parser.add_argument("--load-repeats", type=int, default=10, help="index loads to time")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent SSE clients")
+    parser.add_argument("--requests", type=int, default=128, help="chat requests in total")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="fake LLM generation speed")
+    parser.add_argument("--output-tokens", type=int, default=64, help="fake LLM tokens per answer")
+    parser.add_argument("--embed-latency-ms", type=float, default=50.0, help="fake embedding latency per request")
+    parser.add_argument("--embed-dim", type=int, default=256, help="fake embedding size")
+    parser.add_argument("--startup-repeats", type=int, default=3, help="server starts to time per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="scratch directory (default: a temporary one, removed afterwards)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Settings are read at import time, so this runs before any app module is imported."""
+    os.environ.update(
+        {
+            "ENVIRONMENT": "benchmark",
+            "MODEL_PROVIDER": "fake",
+            "FAKE_LLM_TTFT_MS": str(args.ttft_ms),
+            "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+            "FAKE_LLM_OUTPUT_TOKENS": str(args.output_tokens),
+            "FAKE_EMBED_LATENCY_MS": str(args.embed_latency_ms),
+            "FAKE_EMBED_DIM": str(args.embed_dim),
+            "TRANSFORM_CACHE_PATH": "cache/transformations.db",
+            "DATABASE_URL": "sqlite+aiosqlite:///./sql_app.db",
+            # Every request must reach the model; the cache would only measure itself
+            "ANSWER_CACHE_MAX_ENTRIES": "0",
+            "INDEX_REFRESH_INTERVAL": "3600",
+            "CHAT_MAX_CONCURRENCY": str(max(args.concurrency, int(os.getenv("CHAT_MAX_CONCURRENCY", "32")))),
+        }
+    )
+
+
+def write_documents(documents_dir: str, count: int, line_items: int, rng: random.Random) -> list:
+    os.makedirs(documents_dir, exist_ok=True)
+    invoices = []
+    for i in range(count):
+        vendor = rng.choice(VENDORS)
+        invoice = f"INV-{2024 + i % 2}-{i:05d}"
+        lines, total = [], 0.0
+        for _ in range(line_items):
+            item = rng.choice(ITEMS)
+            quantity = rng.randint(1, 40)
+            price = round(rng.uniform(5, 500), 2)
+            total += quantity * price
+            lines.append(f"- {item}: {quantity} x ${price:,.2f} = ${quantity * price:,.2f}")
+        text = (
+            f"Invoice {invoice}\n"
+            f"Vendor: {vendor}\nBill to: Example Holdings Ltd\n"
+            f"Issue date: 2024-{1 + i % 12:02d}-{1 + i % 28:02d}\nPayment terms: Net {rng.choice([15, 30, 45, 60])}\n\n"
+            "Line items:\n" + "\n".join(lines) + f"\n\nTotal due: ${total:,.2f}\n"
+        )
+        with open(os.path.join(documents_dir, f"invoice_{i:05d}.txt"), "w") as f:
+            f.write(text)
+        invoices.append((invoice, vendor))
+    return invoices
+
+
+def make_queries(invoices: list, count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        invoice, vendor = rng.choice(invoices)
+        queries.append(rng.choice(QUESTIONS).format(invoice=invoice, vendor=vendor, item=rng.choice(ITEMS)))
+    return queries
+
+
+def latency_summary(samples: list) -> dict:
+    """Milliseconds; percentiles use linear interpolation."""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def bench_ingestion(li, documents_dir: str) -> dict:
+    from utils.manifest import list_document_files
+
+    files = list_document_files(documents_dir)
+    start = time.perf_counter()
+    doc_ids, nodes = li.ingestion_engine.run(files)
+    pipeline_seconds = time.perf_counter() - start
+
+    # The build re-runs the pipeline against the now warm transformation cache
+    start = time.perf_counter()
+    li._update_or_create_index(documents_dir, force_reindex=True)
+    build_seconds = time.perf_counter() - start
+    return {
+        "documents": len(doc_ids),
+        "nodes": len(nodes),
+        "pipeline_seconds": round(pipeline_seconds, 3),
+        "documents_per_second": round(len(doc_ids) / pipeline_seconds, 2),
+        "nodes_per_second": round(len(nodes) / pipeline_seconds, 2),
+        "index_build_seconds_warm_cache": round(build_seconds, 3),
+    }
+
+
+def bench_load(li, repeats: int) -> dict:
+    from utils.storage import load_index
+    from utils.vector_store import NumpyVectorStore
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load_index("storage", NumpyVectorStore.from_persist_dir("storage", **li.VECTOR_STORE_KWARGS))
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+async def bench_retrieval(li, queries: list) -> dict:
+    from llama_index.core.schema import QueryBundle
+    from utils.storage import load_index
+    from utils.vector_store import NumpyVectorStore
+
+    index = load_index("storage", NumpyVectorStore.from_persist_dir("storage", **li.VECTOR_STORE_KWARGS))
+    retriever = li.build_retriever(index)
+    samples, nodes_out = [], []
+    for query in queries:
+        bundle = QueryBundle(query)
+        start = time.perf_counter()
+        nodes = li.context_packer.postprocess_nodes(await retriever.aretrieve(bundle), query_bundle=bundle)
+        samples.append(time.perf_counter() - start)
+        nodes_out.append(len(nodes))
+    return {
+        "mode": li.RETRIEVAL_MODE,
+        "includes_query_embedding_ms": float(os.environ["FAKE_EMBED_LATENCY_MS"]),
+        "mean_nodes": round(float(np.mean(nodes_out)), 2),
+        "latency": latency_summary(samples),
+    }
+
+
+async def bench_chat(queries: list, concurrency: int, total_requests: int) -> dict:
+    import httpx
+    import uvicorn
+
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if serve_task.done():
+            serve_task.result()
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    ttfts, totals, statuses = [], [], {}
+    next_request = 0
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=300) as client:
+        response = await client.post(
+            "/auth/register",
+            json={"username": "bench", "full_name": "Benchmark", "email": "bench@example.com", "password": "bench"},
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        # The index loads in the background after startup; chat answers 503 until it has
+        while (await client.get("/health/ready")).status_code != 200:
+            await asyncio.sleep(0.05)
+
+        async def sse_client() -> None:
+            nonlocal next_request
+            while next_request < total_requests:
+                i = next_request
+                next_request += 1
+                # Distinct text per request so concurrent identical queries are not coalesced
+                payload = {"content": f"{queries[i % len(queries)]} (request {i})"}
+                start = time.perf_counter()
+                first = None
+                async with client.stream("POST", "/chat/sendMessage", json=payload, headers=headers) as response:
+                    async for line in response.aiter_lines():
+                        if first is None and line.startswith("data:") and '"content"' in line:
+                            first = time.perf_counter() - start
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 200 and first is not None:
+                    ttfts.append(first)
+                    totals.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sse_client() for _ in range(concurrency)))
+        wall_seconds = time.perf_counter() - start
+
+    server.should_exit = True
+    await serve_task
+    query_embedder = sys.modules["utils.llama_integration"].query_embedder
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "requests_per_second": round(len(totals) / wall_seconds, 2),
+        "time_to_first_token": latency_summary(ttfts),
+        "total_time": latency_summary(totals),
+        # Concurrent queries share batched embedding requests; see utils/query_embedder.py
+        "query_embedding_requests": query_embedder.requests,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _time_import(cwd: str) -> float:
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def _time_server_start(cwd: str, timeout: float = 600.0) -> dict:
+    """Seconds from spawning uvicorn until /health/live and then /health/ready return 200."""
+    import httpx
+
+    port = _free_port()
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    timings = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            for probe in ("live", "ready"):
+                while f"{probe}_seconds" not in timings:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"Server exited with code {process.returncode} during startup")
+                    if time.perf_counter() - start > timeout:
+                        raise RuntimeError(f"Server not {probe} after {timeout}s")
+                    try:
+                        if client.get(f"/health/{probe}").status_code == 200:
+                            timings[f"{probe}_seconds"] = time.perf_counter() - start
+                            continue
+                    except httpx.TransportError:
+                        pass
+                    time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+    return timings
+
+
+def bench_startup(documents_dir: str, repeats: int) -> dict:
+    def summary(runs: list) -> dict:
+        return {
+            "import_main": latency_summary([run["import_seconds"] for run in runs]),
+            "live": latency_summary([run["live_seconds"] for run in runs]),
+            "ready": latency_summary([run["ready_seconds"] for run in runs]),
+        }
+
+    # The index built by the earlier sections is in the working directory
+    existing = []
+    for _ in range(repeats):
+        existing.append({"import_seconds": _time_import("."), **_time_server_start(".")})
+
+    # A directory with only the documents: every start builds the index through
+    # the whole pipeline, the transformation cache included
+    empty = []
+    for i in range(repeats):
+        cwd = f"startup-empty-{i}"
+        os.makedirs(cwd)
+        shutil.copytree(documents_dir, os.path.join(cwd, "documents"))
+        empty.append({"import_seconds": _time_import(cwd), **_time_server_start(cwd)})
+        shutil.rmtree(cwd, ignore_errors=True)
+    return {"existing_index": summary(existing), "no_index": summary(empty)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    args = parse_args()
+    sections = [name for name in args.sections.split(",") if name]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        sys.exit(f"Unknown sections: {', '.join(sorted(unknown))}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    configure_environment(args)
+    sys.path.insert(0, REPO_ROOT)
+    # Storage, caches and the database use paths relative to the working directory
+    os.chdir(workdir)
+
+    rng = random.Random(args.seed)
+    invoices = write_documents("documents", args.documents, args.line_items, rng)
+    queries = make_queries(invoices, args.queries, rng)
+
+    import utils.llama_integration as li
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    try:
+        if "ingestion" in sections:
+            results["ingestion"] = bench_ingestion(li, "documents")
+        else:
+            li._update_or_create_index("documents", force_reindex=True)
+        if "load" in sections:
+            results["load"] = bench_load(li, args.load_repeats)
+        if "retrieval" in sections:
+            results["retrieval"] = asyncio.run(bench_retrieval(li, queries))
+        if "chat" in sections:
+            results["chat"] = asyncio.run(bench_chat(queries, args.concurrency, args.requests))
+        if "startup" in sections:
+            results["startup"] = bench_startup("documents", args.startup_repeats)
+    finally:
+        os.chdir(REPO_ROOT)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "workdir")},
+        "settings": {
+            "retrieval_mode": li.RETRIEVAL_MODE,
+            "retrieval_top_k": li.RETRIEVAL_TOP_K,
+            "retrieval_candidates": li.RETRIEVAL_CANDIDATES,
+            "vector_store": li.VECTOR_STORE_KWARGS,
+            "context_token_budget": li.CONTEXT_TOKEN_BUDGET,
+            "sse_flush_policy": li.SSE_FLUSH_POLICY.value,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
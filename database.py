@@ -1,11 +1,37 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import os
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import declarative_base, sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"  # Use your actual database URL
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./sql_app.db')
+# SQL statement logging is for debugging only; it costs a log record per query
+DATABASE_ECHO = os.getenv('DATABASE_ECHO', 'false').lower() == 'true'
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', '10'))
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+# The one engine for the app: pooled, async, shared by every request handler
+async_engine = create_async_engine(
+    DATABASE_URL,
+    echo=DATABASE_ECHO,
+    pool_size=DATABASE_POOL_SIZE,
+    max_overflow=DATABASE_MAX_OVERFLOW,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+
+if async_engine.dialect.name == "sqlite":
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the single writer; NORMAL sync is durable in WAL mode
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, expire_on_commit=False, class_=AsyncSession
+)
+Base = declarative_base()
+
+async def get_db():
+    async with AsyncSessionLocal() as session:
+        yield session
@@ -1,6 +1,6 @@
 from llama_index.core.extractors.interface import BaseExtractor
 from llama_index.core.llms.llm import LLM
-from llama_index.core.bridge.pydantic import Field, SerializeAsAny
+from llama_index.core.bridge.pydantic import Field, PrivateAttr, SerializeAsAny
 from typing import Any, Dict, List, Optional, Sequence
 from llama_index.core.prompts import PromptTemplate
 from llama_index.core.schema import BaseNode, TextNode
@@ -41,6 +41,8 @@ class ComplianceChecker(BaseExtractor):
         default=True, description="Whether to use metadata for emebddings only."
     )
 
+    _prompt: PromptTemplate = PrivateAttr()
+
     def __init__(
         self,
         llm: Optional[LLM] = None,
@@ -64,10 +66,11 @@ class ComplianceChecker(BaseExtractor):
             num_workers=num_workers,
             **kwargs,
         )
+        self._prompt = PromptTemplate(template=prompt_template)
 
     @classmethod
     def class_name(cls) -> str:
-        return "QuestionsAnsweredExtractor"
+        return "ComplianceChecker"
 
     async def _aextract_issues_from_node(self, node: BaseNode) -> Dict[str, str]:
         """Extract issues from a node and return it's metadata dict."""
@@ -75,9 +78,8 @@ class ComplianceChecker(BaseExtractor):
             return {}
 
         context_str = node.get_content(metadata_mode=self.metadata_mode)
-        prompt = PromptTemplate(template=self.prompt_template)
         issues = await self.llm.apredict(
-            prompt, num_issues=self.issues, context_str=context_str
+            self._prompt, num_issues=self.issues, context_str=context_str
         )
 
         return {"compliance_issues": issues.strip()}
@@ -0,0 +1,210 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from llama_index.core.async_utils import DEFAULT_NUM_WORKERS, run_jobs
+from llama_index.core.bridge.pydantic import BaseModel, Field, PrivateAttr, SerializeAsAny
+from llama_index.core.extractors.interface import BaseExtractor
+from llama_index.core.llms.llm import LLM
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.schema import BaseNode, TextNode
+from llama_index.core.settings import Settings
+
+from prompts.chat_prompts import (
+    ANOMALY_DETECTOR_TMPL,
+    FUSED_ENRICHMENT_TMPL,
+    KEY_INFO_EXTRACTOR_TMPL,
+    RISK_ASSESSMENT_TMPL,
+)
+
+# Optional enrichment -> instruction appended to the fused prompt
+OPTIONAL_ENRICHMENTS = {
+    "key_info": KEY_INFO_EXTRACTOR_TMPL,
+    "anomalies": ANOMALY_DETECTOR_TMPL,
+    "risk_assessment": RISK_ASSESSMENT_TMPL,
+}
+
+
+class ExcerptEnrichment(BaseModel):
+    """Enrichments for a single excerpt."""
+
+    excerpt_id: int
+    title: str
+    questions: List[str]
+    compliance_issues: str
+    key_info: Optional[str] = None
+    anomalies: Optional[str] = None
+    risk_assessment: Optional[str] = None
+
+
+class EnrichmentBatch(BaseModel):
+    """Enrichments for every excerpt in the prompt."""
+
+    excerpts: List[ExcerptEnrichment]
+
+
+class InvoiceEnrichmentExtractor(BaseExtractor):
+    """
+    Fused invoice enrichment. Node-level extractor.
+    Extracts `document_title`, `questions_this_excerpt_can_answer` and
+    `compliance_issues` (plus any of `key_info`, `anomalies`, `risk_assessment`)
+    with a single structured-output call per pack of nodes.
+
+    Args:
+        llm (Optional[LLM]): LLM
+        questions (int): number of questions to generate per node
+        issues (int): number of compliance issues to check for
+        enrichments (List[str]): optional enrichments to include
+        nodes_per_call (int): maximum number of nodes packed into one prompt
+        max_chars_per_call (int): maximum excerpt characters packed into one prompt
+        prompt_template (str): template for the fused call
+    """
+
+    llm: SerializeAsAny[LLM] = Field(description="The LLM to use for generation.")
+    questions: int = Field(
+        default=5,
+        description="The number of questions to generate per node.",
+        gt=0,
+    )
+    issues: int = Field(
+        default=5,
+        description="The number of compliance issues to check for.",
+        gt=0,
+    )
+    enrichments: List[str] = Field(
+        default_factory=list,
+        description="Optional enrichments to include: key_info, anomalies, risk_assessment.",
+    )
+    nodes_per_call: int = Field(
+        default=4,
+        description="The maximum number of nodes packed into one prompt.",
+        gt=0,
+    )
+    max_chars_per_call: int = Field(
+        default=8000,
+        description="The maximum number of excerpt characters packed into one prompt.",
+        gt=0,
+    )
+    prompt_template: str = Field(
+        default=FUSED_ENRICHMENT_TMPL,
+        description="Prompt template to use for the fused call.",
+    )
+
+    _prompt: PromptTemplate = PrivateAttr()
+
+    def __init__(
+        self,
+        llm: Optional[LLM] = None,
+        questions: int = 5,
+        issues: int = 5,
+        enrichments: Optional[List[str]] = None,
+        nodes_per_call: int = 4,
+        max_chars_per_call: int = 8000,
+        prompt_template: str = FUSED_ENRICHMENT_TMPL,
+        num_workers: int = DEFAULT_NUM_WORKERS,
+        **kwargs: Any,
+    ) -> None:
+        """Init params."""
+        unknown = set(enrichments or []) - set(OPTIONAL_ENRICHMENTS)
+        if unknown:
+            raise ValueError(f"Unknown enrichments: {', '.join(sorted(unknown))}")
+
+        super().__init__(
+            llm=llm or Settings.llm,
+            questions=questions,
+            issues=issues,
+            enrichments=enrichments or [],
+            nodes_per_call=nodes_per_call,
+            max_chars_per_call=max_chars_per_call,
+            prompt_template=prompt_template,
+            num_workers=num_workers,
+            **kwargs,
+        )
+        self._prompt = PromptTemplate(template=prompt_template)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "InvoiceEnrichmentExtractor"
+
+    def _pack(self, nodes: Sequence[BaseNode]) -> List[List[BaseNode]]:
+        """Greedily pack consecutive nodes into prompts bounded by count and size."""
+        packs: List[List[BaseNode]] = []
+        current: List[BaseNode] = []
+        current_chars = 0
+        for node in nodes:
+            size = len(node.get_content(metadata_mode=self.metadata_mode))
+            if current and (
+                len(current) >= self.nodes_per_call or current_chars + size > self.max_chars_per_call
+            ):
+                packs.append(current)
+                current, current_chars = [], 0
+            current.append(node)
+            current_chars += size
+        if current:
+            packs.append(current)
+        return packs
+
+    def _to_metadata(self, enrichment: Optional[ExcerptEnrichment]) -> Dict[str, str]:
+        if enrichment is None:
+            return {}
+        metadata = {
+            "document_title": enrichment.title.strip(),
+            "questions_this_excerpt_can_answer": "\n".join(
+                question.strip() for question in enrichment.questions
+            ),
+            "compliance_issues": enrichment.compliance_issues.strip(),
+        }
+        for name in self.enrichments:
+            metadata[name] = (getattr(enrichment, name) or "").strip()
+        return metadata
+
+    async def _aextract_pack(self, pack: List[BaseNode]) -> List[Dict[str, str]]:
+        """Enrich a pack of nodes with one LLM call and split the result back per node."""
+        excerpts_str = "\n\n".join(
+            f"[excerpt_id: {i}]\n{node.get_content(metadata_mode=self.metadata_mode)}"
+            for i, node in enumerate(pack)
+        )
+        extra_instructions_str = "".join(
+            f"- {name}: {OPTIONAL_ENRICHMENTS[name]}\n" for name in self.enrichments
+        )
+        result = await self.llm.astructured_predict(
+            EnrichmentBatch,
+            self._prompt,
+            num_excerpts=len(pack),
+            excerpts_str=excerpts_str,
+            num_questions=self.questions,
+            num_issues=self.issues,
+            extra_instructions_str=extra_instructions_str,
+        )
+        by_id = {excerpt.excerpt_id: excerpt for excerpt in result.excerpts}
+        if len(by_id) != len(pack):
+            logging.warning(f"Fused enrichment returned {len(by_id)} of {len(pack)} excerpts")
+        return [self._to_metadata(by_id.get(i)) for i in range(len(pack))]
+
+    async def aextract(self, nodes: Sequence[BaseNode]) -> List[Dict]:
+        eligible = [
+            node for node in nodes if not self.is_text_node_only or isinstance(node, TextNode)
+        ]
+        packs = self._pack(eligible)
+        pack_jobs = [self._aextract_pack(pack) for pack in packs]
+        pack_results: List[List[Dict]] = await run_jobs(
+            pack_jobs, show_progress=self.show_progress, workers=self.num_workers
+        )
+        extracted = {
+            id(node): metadata
+            for pack, metadata_list in zip(packs, pack_results)
+            for node, metadata in zip(pack, metadata_list)
+        }
+
+        # Keep one title per document, like TitleExtractor does
+        titles: Dict[str, str] = {}
+        for node in eligible:
+            title = extracted[id(node)].get("document_title")
+            if title and node.ref_doc_id:
+                titles.setdefault(node.ref_doc_id, title)
+        metadata_list: List[Dict] = []
+        for node in nodes:
+            metadata = extracted.get(id(node), {})
+            if metadata and node.ref_doc_id in titles:
+                metadata["document_title"] = titles[node.ref_doc_id]
+            metadata_list.append(metadata)
+        return metadata_list
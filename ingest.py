@@ -0,0 +1,98 @@
+"""
+Single-writer ingestion process for multi-worker deployments.
+
+Watches the documents directory and publishes a new immutable index snapshot
+to SNAPSHOT_DIR whenever it changes. It also drains the queue of documents
+uploaded through `POST /documents`. Serving workers started with
+INDEX_SOURCE=snapshots load the latest snapshot read-only and switch to newer
+ones as they are published; they never ingest or write themselves.
+
+    python ingest.py                  # keep publishing as documents change
+    python ingest.py --once           # run queued uploads, publish once (if anything changed) and exit
+    INDEX_SOURCE=snapshots uvicorn main:app --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import List
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents-dir", default="documents")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between checks for changed documents")
+    parser.add_argument("--once", action="store_true", help="publish at most one snapshot, then exit")
+    parser.add_argument("--force-reindex", action="store_true", help="rebuild the first snapshot from scratch")
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace) -> None:
+    import utils.llama_integration as li
+    from utils.index_holder import documents_fingerprint
+    from database import AsyncSessionLocal, async_engine, Base
+    from models import ingestion_job, user  # registers the tables with Base
+    from routers.documents import job_queue as upload_queue
+    from utils.ingestion_jobs import IngestionJobQueue
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Queued uploads and directory changes both publish; one build at a time
+    publish_lock = asyncio.Lock()
+    force_reindex = args.force_reindex
+
+    async def publish():
+        nonlocal force_reindex
+        async with publish_lock:
+            fingerprint = await asyncio.to_thread(documents_fingerprint, args.documents_dir)
+            await asyncio.to_thread(li.publish_snapshot, args.documents_dir, force_reindex)
+            force_reindex = False
+            return fingerprint
+
+    async def ingest_uploads(paths: List[str]):
+        await publish()
+
+    # Same queue the API enqueues to, but each batch ends in a published snapshot
+    job_queue = IngestionJobQueue(
+        AsyncSessionLocal,
+        ingest_uploads,
+        documents_dir=args.documents_dir,
+        batch_size=upload_queue.batch_size,
+        max_attempts=upload_queue.max_attempts,
+        poll_interval=upload_queue.poll_interval,
+    )
+
+    with li.snapshot_store.writer_lock():
+        logging.info(f"Publishing index snapshots of {args.documents_dir} to {li.SNAPSHOT_DIR}")
+        if args.once:
+            await job_queue.recover()
+            await job_queue.drain()
+        else:
+            await job_queue.start()
+        last_fingerprint = None
+        try:
+            while True:
+                fingerprint = await asyncio.to_thread(documents_fingerprint, args.documents_dir)
+                if fingerprint != last_fingerprint:
+                    try:
+                        last_fingerprint = await publish()
+                    except Exception as e:
+                        logging.error(f"Failed to publish index snapshot: {str(e)}")
+                        if args.once:
+                            sys.exit(1)
+                if args.once:
+                    return
+                await asyncio.sleep(args.interval)
+        finally:
+            await job_queue.stop()
+            li.ingestion_engine.shutdown()
+            await async_engine.dispose()
+
+
+def main() -> None:
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
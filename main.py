@@ -1,42 +1,68 @@
 import nest_asyncio
 nest_asyncio.apply()
 
-import tracemalloc
-tracemalloc.start()
+import utils.environment  # loads .env and configures logging before anything reads settings
 
+import asyncio
+import importlib
+import sys
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, chat
-from database import engine, Base
-from utils.llama_integration import update_or_create_index
-
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from routers import auth, chat, documents, health, metrics
+from database import async_engine, Base
+from utils.profiling import (
+    PROFILE_MODE,
+    PROFILE_MODES,
+    PROFILE_OUTPUT_DIR,
+    PROFILE_REQUESTS,
+    PROFILE_TOP,
+    ProcessProfiler,
+    ProfilingMiddleware,
+)
+from utils.security import password_hasher
+from utils.warmup import warmup
+from models import conversation, ingestion_job, user  # registers the tables with Base
 
-# Configure your async database engine
-DATABASE_URL = "sqlite+aiosqlite:///./sql_app.db"  # Example for SQLite
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+# Profiling is opt-in; see utils/profiling.py
+process_profiler = ProcessProfiler(PROFILE_MODE, PROFILE_OUTPUT_DIR, top=PROFILE_TOP)
 
-# Create an async session
-AsyncSessionLocal = sessionmaker(
-    bind=async_engine, expire_on_commit=False, class_=AsyncSession
-)
+async def load_index():
+    # llama_index, the model clients and the pipeline are imported here, off the
+    # event loop, rather than when main is imported; the server is already accepting
+    # connections (health checks, auth) while this and the index load run
+    llama_integration = await asyncio.to_thread(importlib.import_module, "utils.llama_integration")
+    # Load the index once and keep it fresh in the background
+    await llama_integration.index_holder.start()
+    if llama_integration.INDEX_SOURCE == 'local':
+        # Uploaded documents are ingested here; with snapshots, ingest.py does it
+        await documents.job_queue.start()
 
 # Define your lifespan function
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup code
+    process_profiler.start()
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    
-    # Initialize your index
-    await update_or_create_index()
+
+    await chat.conversation_store.start()
+    # Chat answers 503 until this finishes; /health/ready reports its progress
+    await warmup.start(load_index)
 
     yield  # The application runs during this yield
 
     # Shutdown code
+    await warmup.stop()
+    await documents.job_queue.stop()
+    await chat.conversation_store.stop()
+    llama_integration = sys.modules.get("utils.llama_integration")
+    if llama_integration is not None:
+        await llama_integration.index_holder.stop()
+        llama_integration.ingestion_engine.shutdown()
     await async_engine.dispose()
+    password_hasher.shutdown()
+    process_profiler.stop()
     # Perform other cleanup tasks here
 
 # Initialize the FastAPI app with the lifespan parameter
@@ -49,8 +75,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Conversation-Id"],
 )
 
+if PROFILE_REQUESTS:
+    # A process-wide CPU profile already owns the profiler hook
+    request_modes = [mode for mode in PROFILE_MODES if not (mode == "cpu" and PROFILE_MODE == "cpu")]
+    app.add_middleware(ProfilingMiddleware, output_dir=PROFILE_OUTPUT_DIR, top=PROFILE_TOP, modes=request_modes)
+
 # Include routers
+app.include_router(health.router)
 app.include_router(auth.router)
-app.include_router(chat.router)
\ No newline at end of file
+app.include_router(chat.router)
+app.include_router(documents.router)
+app.include_router(metrics.router)
\ No newline at end of file
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
+from database import Base
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    id = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    title = Column(String)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    # Serves "latest conversation of a user"
+    __table_args__ = (Index("ix_conversations_user_updated", "user_id", "updated_at"),)
+
+class ConversationMessage(Base):
+    __tablename__ = "messages"
+
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(String(64), ForeignKey("conversations.id"), nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    # Serves keyset pagination of one conversation by message id
+    __table_args__ = (Index("ix_messages_conversation_id_id", "conversation_id", "id"),)
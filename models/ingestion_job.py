@@ -0,0 +1,23 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
+from database import Base
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # As uploaded, and the file under documents/ it is ingested as; that name is prefixed
+    # with the job id, so the document stays tied to the user who uploaded it
+    filename = Column(String, nullable=False)
+    document = Column(String, nullable=False, unique=True)
+    size = Column(Integer, nullable=False)
+    # queued -> running -> done | failed; running jobs are queued again after a restart
+    status = Column(String(16), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    # Serves "oldest queued jobs first"
+    __table_args__ = (Index("ix_ingestion_jobs_status_created", "status", "created_at"),)
@@ -93,6 +93,68 @@ standard accounting practices and regulatory requirements, \
 noting any missing mandatory information or formatting issues.
 """
 
+# Instructions for the optional enrichments the fused extractor can add to each node
+KEY_INFO_EXTRACTOR_TMPL = """\
+Extract all critical details from the invoice, including invoice number, date, \
+vendor information, purchaser details, line items with descriptions, quantities, \
+unit prices, subtotals, taxes, discounts, total amount due, payment terms, and due date.\
+"""
+ANOMALY_DETECTOR_TMPL = """\
+Analyze the invoice for any discrepancies or anomalies, such as mismatched totals, \
+missing line items, incorrect calculations, unusual payment terms, \
+or inconsistent vendor information.\
+"""
+RISK_ASSESSMENT_TMPL = """\
+Assess the risk associated with processing the invoice by evaluating factors like \
+unfamiliar vendors, unusually high amounts, changes in banking details, \
+or inconsistent billing patterns.\
+"""
+
+# One structured call covering the title, question, and compliance extractors
+FUSED_ENRICHMENT_TMPL = """\
+Here are {num_excerpts} excerpts from invoice documents, each introduced by its excerpt_id:
+{excerpts_str}
+
+For every excerpt, return one entry with its excerpt_id and:
+- title: a title for the document the excerpt comes from that summarizes \
+all of the unique entities, titles or themes found in it.
+- questions: {num_questions} questions the excerpt can provide specific answers to \
+which are unlikely to be found elsewhere.
+- compliance_issues: verify that the invoice complies with standard accounting \
+practices and regulatory requirements, noting up to {num_issues} missing mandatory \
+items or formatting issues.
+{extra_instructions_str}
+Judge each excerpt only on its own content.
+"""
+
+# Chat memory: follow-ups are rewritten into standalone questions for retrieval,
+# and turns that fall out of the history budget are folded into a running summary
+CONDENSE_QUESTION_TMPL = """Here is the summary of an earlier conversation about invoice documents (may be empty):
+{summary_str}
+
+Here are the most recent messages of that conversation:
+{history_str}
+
+Rewrite the follow-up question below as a single standalone question that can be \
+understood without the conversation, keeping every invoice number, vendor, date \
+and amount it refers to. If it is already standalone, return it unchanged. \
+Return only the question.
+
+Follow-up question: {question_str}
+Standalone question: """
+
+SUMMARIZE_HISTORY_TMPL = """Here is the summary of a conversation about invoice documents so far (may be empty):
+{summary_str}
+
+Here are the messages that followed it:
+{history_str}
+
+Write an updated summary of the whole conversation in at most {max_words} words. \
+Keep the documents, invoice numbers, vendors, dates, amounts and conclusions \
+that later questions may refer to, and drop pleasantries and repetition.
+
+Updated summary: """
+
 """   
 # text qa prompt
 COMPLIANCE_CHECKER_SYSTEM_PROMPT = ChatMessage(
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
 from schemas import auth as auth_schemas
 from models.user import User
 from utils.security import (
@@ -13,11 +15,11 @@ from utils.security import (
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
-
 @router.post("/token", response_model=auth_schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)
+):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -31,10 +33,10 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/register", response_model=auth_schemas.Token)
-async def register_user(user: auth_schemas.UserCreate):
-    db_user = create_user(user)
+async def register_user(user: auth_schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await create_user(db, user)
     if db_user is None:
-        raise HTTPException(status_code=400, detail="Username already registered")
+        raise HTTPException(status_code=400, detail="Username or email already registered")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": db_user.username}, expires_delta=access_token_expires
@@ -1,35 +1,169 @@
-import json
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+import os
+import uuid
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from schemas import auth as auth_schemas
 from schemas import chat as chat_schemas
-from utils.security import oauth2_scheme
-from utils.llama_integration import get_ai_response
+from database import AsyncSessionLocal
+from utils.chat_memory import ChatMemory
+from utils.concurrency import ConcurrencyLimiter, Overloaded
+from utils.conversation_store import ConversationStore
+from utils.security import get_current_user
+from utils import metrics
+from utils.sse import encode_event
+from utils.warmup import warmup
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Per-worker cap on concurrent chat streams; excess requests queue briefly, then get a 429
+chat_limiter = ConcurrencyLimiter(
+    max_concurrency=int(os.getenv('CHAT_MAX_CONCURRENCY', '32')),
+    max_queue=int(os.getenv('CHAT_MAX_QUEUE', '64')),
+    queue_timeout=float(os.getenv('CHAT_QUEUE_TIMEOUT', '10')),
+)
+metrics.gauge(
+    "chat_streams",
+    "Chat streams on this worker by state.",
+    lambda: {("in_flight",): chat_limiter.in_flight, ("waiting",): chat_limiter.waiting},
+    labels=("state",),
+)
+
+# Chat history is written behind the response stream in batches
+conversation_store = ConversationStore(
+    AsyncSessionLocal,
+    batch_size=int(os.getenv('CONVERSATION_BATCH_SIZE', '200')),
+    max_queue=int(os.getenv('CONVERSATION_MAX_QUEUE', '10000')),
+)
+
+# Follow-ups are answered with the conversation's recent messages plus a rolling summary
+# of older ones; MEMORY_TOKEN_BUDGET bounds the recent messages sent to the LLM
+MEMORY_LOAD_MESSAGES = int(os.getenv('MEMORY_LOAD_MESSAGES', '50'))
+
+async def _load_history(user_id: int, conversation_id: str):
+    _, messages, _ = await conversation_store.history(
+        user_id, conversation_id=conversation_id, limit=MEMORY_LOAD_MESSAGES
+    )
+    return [(m.role, m.content) for m in messages], messages[-1].id if messages else 0
+
+# Cached conversations are checked against the database on each turn, so turns
+# answered by other workers are picked up
+chat_memory = ChatMemory(
+    _load_history,
+    counter=conversation_store.count_after,
+    token_budget=int(os.getenv('MEMORY_TOKEN_BUDGET', '1500')),
+    summary_tokens=int(os.getenv('MEMORY_SUMMARY_TOKENS', '300')),
+    max_conversations=int(os.getenv('MEMORY_MAX_CONVERSATIONS', '10000')),
+    load_messages=MEMORY_LOAD_MESSAGES,
+)
+
+# Until warm-up finishes, chat waits up to CHAT_READY_TIMEOUT seconds for it and then gets a 503
+CHAT_READY_TIMEOUT = float(os.getenv('CHAT_READY_TIMEOUT', '0'))
+
+def _metadata_filters(message: chat_schemas.Message):
+    if not message.filters:
+        return None
+    # Imported here rather than at startup; see utils/warmup.py
+    from llama_index.core.vector_stores.types import FilterCondition, FilterOperator, MetadataFilter, MetadataFilters
+    from utils.metadata_index import INDEXED_METADATA_KEYS
+
+    unknown = sorted({f.key for f in message.filters} - set(INDEXED_METADATA_KEYS))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot filter on {', '.join(unknown)}; indexed keys are {', '.join(INDEXED_METADATA_KEYS)}",
+        )
+    for f in message.filters:
+        if f.operator in ("in", "nin") and (not isinstance(f.value, list) or not f.value):
+            raise HTTPException(status_code=400, detail=f"Filter '{f.operator}' on {f.key} needs a non-empty list")
+        if f.operator not in ("in", "nin") and isinstance(f.value, list):
+            raise HTTPException(status_code=400, detail=f"Filter '{f.operator}' on {f.key} takes a single value")
+    return MetadataFilters(
+        filters=[
+            MetadataFilter(key=f.key, value=f.value, operator=FilterOperator(f.operator))
+            for f in message.filters
+        ],
+        condition=FilterCondition(message.filter_condition),
+    )
+
 @router.post("/sendMessage")
-async def chat(message: chat_schemas.Message):
-    logging.info(f"Received message: {message.content}")
+async def chat(message: chat_schemas.Message, current_user: auth_schemas.User = Depends(get_current_user)):
+    logging.info(f"Received message from {current_user.username}: {message.content}")
+    if not await warmup.wait(CHAT_READY_TIMEOUT):
+        raise HTTPException(
+            status_code=503,
+            detail="Server is still starting up, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    from utils.llama_integration import get_ai_response
+
+    filters = _metadata_filters(message)
+    try:
+        permit = await chat_limiter.acquire()
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+
+    conversation_id = message.conversation_id or uuid.uuid4().hex
+    try:
+        memory = await chat_memory.get(
+            current_user.id, conversation_id, load=message.conversation_id is not None
+        )
+    except Exception:
+        permit.release()
+        raise
+    conversation_store.record(conversation_id, current_user.id, "user", message.content)
+
+    def record_answer(answer: str):
+        conversation_store.record(conversation_id, current_user.id, "assistant", answer)
+
     async def generate():
         try:
-            async for chunk in get_ai_response(message.content):
-                # Optional: Log or process the JSON data
-                try:
-                    json_data = json.loads(chunk.replace('data:', ''))
-                    logging.debug(f"Sending JSON chunk: {json_data}")
-                except json.JSONDecodeError:
-                    logging.warning(f"Failed to parse JSON from chunk: {chunk}")
-                yield chunk
-            logging.info("Finished generating response")
+            events = 0
+            async for event in get_ai_response(
+                message.content, filters, on_complete=record_answer, memory=memory
+            ):
+                events += 1
+                yield event
+            logging.info(f"Finished generating response ({events} events)")
         except Exception as e:
             logging.error(f"Error in generate: {str(e)}")
-            error_json = json.dumps({"type": "error", "text": str(e)})
-            yield f"data:{error_json}\n"
+            yield encode_event({"type": "error", "text": str(e)})
+        finally:
+            permit.release()
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    # The background task also covers clients that disconnect before the stream starts
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"X-Conversation-Id": conversation_id},
+        background=BackgroundTask(permit.release),
+    )
 
 @router.get("/getResponse", response_model=chat_schemas.Response)
-async def get_response(token: str = Depends(oauth2_scheme)):
-    # Retrieve the latest AI response (placeholder)
-    return {"content": "Latest AI response will be here."}
\ No newline at end of file
+async def get_response(
+    conversation_id: Optional[str] = None,
+    before: Optional[int] = None,
+    limit: int = Query(default=50, ge=1, le=200),
+    current_user: auth_schemas.User = Depends(get_current_user),
+):
+    # Make this user's recent messages on this worker visible before reading; other
+    # users' writes queued behind them are not waited for
+    await conversation_store.flush(current_user.id)
+    found_id, messages, next_before = await conversation_store.history(
+        current_user.id, conversation_id=conversation_id, before=before, limit=limit
+    )
+    if conversation_id is not None and found_id is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    latest = next((m.content for m in reversed(messages) if m.role == "assistant"), "")
+    return {
+        "content": latest,
+        "conversation_id": found_id,
+        "messages": messages,
+        "next_before": next_before,
+    }
\ No newline at end of file
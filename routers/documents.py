@@ -0,0 +1,95 @@
+import logging
+import os
+import re
+import uuid
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from schemas import auth as auth_schemas
+from schemas import documents as documents_schemas
+from database import AsyncSessionLocal
+from utils.ingestion_jobs import IngestionJobQueue, upload_path
+from utils.security import get_current_user
+from utils.uploads import UploadError, UploadTooLarge, receive_file
+
+router = APIRouter(prefix="/documents", tags=["documents"])
+
+DOCUMENTS_DIR = "documents"
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._ -]")
+
+async def _ingest_uploads(paths: List[str]):
+    # The uploads are in the documents directory by now; a refresh ingests whatever
+    # changed there and swaps the new index in. Imported here; see utils/warmup.py
+    from utils.llama_integration import index_holder
+    await index_holder.refresh()
+
+# Drained in this process when INDEX_SOURCE is 'local'; with snapshots, `python ingest.py` drains it
+job_queue = IngestionJobQueue(
+    AsyncSessionLocal,
+    _ingest_uploads,
+    documents_dir=DOCUMENTS_DIR,
+    batch_size=int(os.getenv('INGEST_JOB_BATCH_SIZE', '16')),
+    max_attempts=int(os.getenv('INGEST_JOB_MAX_ATTEMPTS', '3')),
+    poll_interval=float(os.getenv('INGEST_JOB_POLL_INTERVAL', '5')),
+)
+
+def _safe_filename(filename: str) -> str:
+    name = _UNSAFE_FILENAME_CHARS.sub("_", os.path.basename(filename or "")).lstrip(". ")
+    if not name:
+        raise HTTPException(status_code=400, detail="Upload needs a file name")
+    return name[:200]
+
+# The body is parsed by utils/uploads.py as it streams in, so it is described here by hand
+_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+@router.post("", status_code=202, response_model=documents_schemas.IngestionJob, openapi_extra=_UPLOAD_BODY)
+async def upload_document(
+    request: Request,
+    response: Response,
+    current_user: auth_schemas.User = Depends(get_current_user),
+):
+    job_id = uuid.uuid4().hex
+    path = upload_path(DOCUMENTS_DIR, job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        filename, size = await receive_file(request, "file", path, UPLOAD_MAX_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        filename = _safe_filename(filename)
+    except HTTPException:
+        os.remove(path)
+        raise
+    # Stored under a name of its own, so an upload never replaces another user's document
+    document = f"{job_id}-{filename}"
+
+    job = await job_queue.enqueue(job_id, current_user.id, filename, document, size)
+    logging.info(f"Queued {filename} ({size} bytes) from {current_user.username} as job {job_id}")
+    response.headers["Location"] = f"{router.prefix}/jobs/{job_id}"
+    result = documents_schemas.IngestionJob.model_validate(job)
+    result.queue_position = await job_queue.position(job)
+    return result
+
+@router.get("/jobs/{job_id}", response_model=documents_schemas.IngestionJob)
+async def get_job(job_id: str, current_user: auth_schemas.User = Depends(get_current_user)):
+    job = await job_queue.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    result = documents_schemas.IngestionJob.model_validate(job)
+    result.queue_position = await job_queue.position(job)
+    return result
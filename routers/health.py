@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+from utils.warmup import warmup
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+@router.get("/live")
+async def live():
+    # The process is up and serving; says nothing about the index
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def ready(response: Response):
+    # 503 until the index is loaded, so load balancers hold traffic back during warm-up
+    if not warmup.ready:
+        response.status_code = 503
+    return warmup.status()
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from utils.metrics import CONTENT_TYPE, registry
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics")
+async def get_metrics():
+    # Prometheus scrape endpoint; values are for this worker process only
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
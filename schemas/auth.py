@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 class Token(BaseModel):
     access_token: str
@@ -8,4 +8,13 @@ class UserCreate(BaseModel):
     username: str
     full_name: str
     email: str
-    password: str
\ No newline at end of file
+    password: str
+
+class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    full_name: str
+    email: str
+    disabled: bool
@@ -1,7 +1,34 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, ConfigDict, Field, StrictFloat, StrictInt, StrictStr
+
+FilterValue = Union[StrictInt, StrictFloat, StrictStr]
+
+class MetadataFilter(BaseModel):
+    key: str
+    value: Union[FilterValue, List[FilterValue]]
+    operator: Literal["==", "!=", ">", ">=", "<", "<=", "in", "nin", "text_match"] = "=="
 
 class Message(BaseModel):
     content: str
+    # Continue an existing conversation; a new one is started when omitted
+    conversation_id: Optional[str] = Field(default=None, min_length=1, max_length=64)
+    filters: List[MetadataFilter] = []
+    filter_condition: Literal["and", "or"] = "and"
+
+class HistoryMessage(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    role: Literal["user", "assistant"]
+    content: str
+    created_at: datetime
 
 class Response(BaseModel):
-    content: str
\ No newline at end of file
+    # Latest assistant answer on this page
+    content: str
+    conversation_id: Optional[str] = None
+    messages: List[HistoryMessage] = []
+    # Pass as `before` to fetch the next older page
+    next_before: Optional[int] = None
+
@@ -0,0 +1,19 @@
+from datetime import datetime
+from typing import Literal, Optional
+from pydantic import BaseModel, ConfigDict
+
+class IngestionJob(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    filename: str
+    document: str
+    size: int
+    status: Literal["queued", "running", "done", "failed"]
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Jobs ahead of this one while it is queued
+    queue_position: Optional[int] = None
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import time
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from utils import bm25, metadata_index
+from utils.hybrid_retriever import HybridRetriever
+from utils.storage import SqliteDocumentStore, SqliteKVStore
+
+
+class DocstoreRetriever(BaseRetriever):
+    """Stands in for the vector leg: reads its nodes through the docstore, as VectorIndexRetriever does."""
+
+    def __init__(self, docstore: SqliteDocumentStore, node_ids) -> None:
+        super().__init__()
+        self._docstore = docstore
+        self._node_ids = node_ids
+
+    def _retrieve(self, query_bundle: QueryBundle):
+        return [NodeWithScore(node=node, score=1.0) for node in self._docstore.get_nodes(self._node_ids)]
+
+
+def test_event_loop_runs_while_lexical_scan_holds_the_lock(tmp_path, monkeypatch):
+    kvstore = SqliteKVStore(os.path.join(tmp_path, "index.db"), schema=(*bm25.SCHEMA, *metadata_index.SCHEMA))
+    docstore = SqliteDocumentStore(kvstore)
+    nodes = [TextNode(id_=f"n{i}", text=f"invoice {i} from acme corp") for i in range(8)]
+    docstore.add_documents(nodes)
+
+    # A slow postings scan, taken while the connection lock is held
+    postings = bm25.BM25Index._postings
+
+    def slow_postings(self, conn, term):
+        time.sleep(0.1)
+        return postings(self, conn, term)
+
+    monkeypatch.setattr(bm25.BM25Index, "_postings", slow_postings)
+    retriever = HybridRetriever(
+        DocstoreRetriever(docstore, [node.node_id for node in nodes[:3]]), docstore, similarity_top_k=3
+    )
+
+    async def main():
+        gaps = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        beat = asyncio.create_task(heartbeat())
+        results = await asyncio.gather(
+            *(retriever.aretrieve(QueryBundle("acme invoice")) for _ in range(4))
+        )
+        done.set()
+        await beat
+        return results, max(gaps)
+
+    results, longest_gap = asyncio.run(main())
+    assert all(len(result) == 3 for result in results)
+    assert longest_gap < 0.05
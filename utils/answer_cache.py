@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive cache key; trailing punctuation is ignored."""
+    return " ".join(text.lower().split()).rstrip("?!. ")
+
+
+class InflightAnswer:
+    """An answer still being generated. Any number of subscribers replay it from the first token."""
+
+    def __init__(self) -> None:
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def _notify(self) -> None:
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def append(self, text: str) -> None:
+        self.tokens.append(text)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            updated = self._updated
+            while position < len(self.tokens):
+                yield self.tokens[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await updated.wait()
+
+
+class _Entry:
+    __slots__ = ("answer", "embedding", "expires_at")
+
+    def __init__(self, answer: str, embedding: Optional[np.ndarray], expires_at: float) -> None:
+        self.answer = answer
+        self.embedding = embedding
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    Answer cache in front of the query engine.
+
+    Answers are keyed by normalized query text plus an optional `scope` (such
+    as the request's metadata filters) and, when `similarity_threshold` is set,
+    unscoped queries are also matched to the nearest cached query embedding
+    above that cosine similarity. Entries are evicted LRU beyond `max_entries` or after `ttl`
+    seconds, and the whole cache is dropped when the index version moves forward;
+    lookups and answers for an older version are ignored.
+    Identical queries that arrive while an answer is being generated share
+    that single upstream call.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        similarity_threshold: Optional[float] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[Tuple[int, str], InflightAnswer] = {}
+        self._version: Optional[int] = None
+        self._matrix: Optional[Tuple[List[str], np.ndarray]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _sync_version(self, version: int) -> bool:
+        """Move the cache forward to `version`. False if `version` is older than the cache's."""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._entries:
+                logging.info(f"Index version changed to {version}; dropping {len(self._entries)} cached answers")
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+        return True
+
+    def _nearest(self, embedding: np.ndarray) -> Optional[str]:
+        if self._matrix is None:
+            keys = [key for key, entry in self._entries.items() if entry.embedding is not None]
+            if not keys:
+                return None
+            self._matrix = (keys, np.stack([self._entries[key].embedding for key in keys]))
+        keys, matrix = self._matrix
+        if not keys:
+            return None
+        scores = matrix @ embedding
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    @staticmethod
+    def _unit(embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _key(query: str, scope: str) -> str:
+        key = normalize_query(query)
+        return f"{key}\x00{scope}" if scope else key
+
+    def get(
+        self, query: str, version: int, embedding: Optional[List[float]] = None, scope: str = ""
+    ) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if not self._sync_version(version):
+            # Served from an index that has since been replaced; nothing cached applies to it
+            self.misses += 1
+            return None
+        key = self._key(query, scope)
+        entry = self._entries.get(key)
+        if entry is None and embedding is not None and self.similarity_threshold is not None and not scope:
+            nearest = self._nearest(self._unit(embedding))
+            entry = self._entries.get(nearest) if nearest is not None else None
+            key = nearest
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.answer
+
+    def put(
+        self,
+        query: str,
+        version: int,
+        answer: str,
+        embedding: Optional[List[float]] = None,
+        scope: str = "",
+    ) -> None:
+        if not self.enabled:
+            return
+        if not self._sync_version(version):
+            # An answer that finished after the index was refreshed; it may already be stale
+            return
+        key = self._key(query, scope)
+        # Scoped answers are only reused for the same scope, never by similarity
+        embedding = None if scope else embedding
+        self._entries[key] = _Entry(answer, self._unit(embedding), time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        self._matrix = None
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def stream(
+        self,
+        query: str,
+        version: int,
+        producer: Callable[[], AsyncIterator[str]],
+        embedding: Optional[List[float]] = None,
+        scope: str = "",
+    ) -> AsyncIterator[str]:
+        """
+        Tokens for `query`, sharing one `producer()` run between identical concurrent queries.
+
+        The run drains in its own task, so it completes (and is cached) even if
+        the client that started it disconnects.
+        """
+        inflight_key = (version, self._key(query, scope))
+        inflight = self._inflight.get(inflight_key)
+        if inflight is not None:
+            self.coalesced += 1
+            logging.info("Joining in-flight answer for identical query")
+            return inflight.subscribe()
+
+        inflight = InflightAnswer()
+        self._inflight[inflight_key] = inflight
+
+        async def drain() -> None:
+            try:
+                async for text in producer():
+                    inflight.append(text)
+            except asyncio.CancelledError as e:
+                inflight.finish(e)
+                raise
+            except Exception as e:
+                inflight.finish(e)
+            else:
+                inflight.finish()
+                self.put(query, version, "".join(inflight.tokens), embedding, scope)
+            finally:
+                self._inflight.pop(inflight_key, None)
+
+        inflight.task = asyncio.create_task(drain())
+        return inflight.subscribe()
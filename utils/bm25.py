@@ -0,0 +1,192 @@
+import logging
+import math
+import re
+import sqlite3
+from collections import Counter, OrderedDict
+from typing import Callable, ContextManager, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.schema import BaseNode, MetadataMode
+
+# Keeps invoice numbers, dates and amounts whole ("inv-2024-001", "1,250.00")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./,:][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were will with".split()
+)
+
+# One posting as read for scoring: the node's row, how often the term occurs in it, and the node's length in tokens
+POSTING = np.dtype([("row", "<i4"), ("tf", "<u2"), ("length", "<u4")])
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS bm25_docs ("
+    "row INTEGER PRIMARY KEY, node_id TEXT NOT NULL UNIQUE, length INTEGER NOT NULL, terms TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS bm25_postings ("
+    "term TEXT NOT NULL, row INTEGER NOT NULL, tf INTEGER NOT NULL, length INTEGER NOT NULL, "
+    "PRIMARY KEY (term, row)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS bm25_stats ("
+    "id INTEGER PRIMARY KEY CHECK (id = 0), docs INTEGER NOT NULL, total_length INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO bm25_stats (id, docs, total_length) VALUES (0, 0, 0)",
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound tokens are also split into their parts."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over node text, stored in the docstore's SQLite file.
+
+    Postings are one row per (term, node), clustered by term, so a lookup is
+    a single range scan per query term and adding or removing a node only
+    touches its own rows. Writes go through the docstore's connection and
+    commit with it. Searches hold that connection, so async callers should
+    run them off the event loop.
+
+    Args:
+        connection: context manager yielding the locked SQLite connection
+        k1 (float): term frequency saturation
+        b (float): document length normalization
+        cache_size (int): number of decoded postings lists kept in memory
+    """
+
+    def __init__(
+        self,
+        connection: Callable[[], ContextManager[sqlite3.Connection]],
+        k1: float = 1.2,
+        b: float = 0.75,
+        cache_size: int = 4096,
+    ) -> None:
+        self._connection = connection
+        self.k1 = k1
+        self.b = b
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def _postings(self, conn: sqlite3.Connection, term: str) -> np.ndarray:
+        postings = self._cache.get(term)
+        if postings is None:
+            cursor = conn.execute("SELECT row, tf, length FROM bm25_postings WHERE term = ?", (term,))
+            postings = np.fromiter(cursor, dtype=POSTING)
+            self._cache[term] = postings
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(term)
+        return postings
+
+    # -- writes -------------------------------------------------------------
+
+    def add(self, nodes: Sequence[BaseNode]) -> None:
+        """Index `nodes`, replacing any earlier version of the same node ids."""
+        if not nodes:
+            return
+        self.remove([node.node_id for node in nodes])
+        postings: List[Tuple[str, int, int, int]] = []
+        added_length = 0
+        with self._connection() as conn:
+            for node in nodes:
+                tokens = tokenize(node.get_content(metadata_mode=MetadataMode.NONE))
+                counts = Counter(tokens)
+                row = conn.execute(
+                    "INSERT INTO bm25_docs (node_id, length, terms) VALUES (?, ?, ?)",
+                    (node.node_id, len(tokens), " ".join(counts)),
+                ).lastrowid
+                postings.extend((term, row, min(tf, 65535), len(tokens)) for term, tf in counts.items())
+                added_length += len(tokens)
+            conn.executemany("INSERT INTO bm25_postings (term, row, tf, length) VALUES (?, ?, ?, ?)", postings)
+            conn.execute(
+                "UPDATE bm25_stats SET docs = docs + ?, total_length = total_length + ?",
+                (len(nodes), added_length),
+            )
+            for term, _, _, _ in postings:
+                self._cache.pop(term, None)
+        logging.debug(f"BM25 indexed {len(nodes)} nodes ({len(postings)} postings)")
+
+    def remove(self, node_ids: Sequence[str]) -> None:
+        if not node_ids:
+            return
+        with self._connection() as conn:
+            docs = []
+            for start in range(0, len(node_ids), 500):
+                chunk = list(node_ids[start : start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                docs.extend(
+                    conn.execute(
+                        f"SELECT row, length, terms FROM bm25_docs WHERE node_id IN ({placeholders})", chunk
+                    ).fetchall()
+                )
+            if not docs:
+                return
+            postings = [(term, row) for row, _, terms in docs for term in terms.split()]
+            conn.executemany("DELETE FROM bm25_postings WHERE term = ? AND row = ?", postings)
+            conn.executemany("DELETE FROM bm25_docs WHERE row = ?", [(row,) for row, _, _ in docs])
+            conn.execute(
+                "UPDATE bm25_stats SET docs = docs - ?, total_length = total_length - ?",
+                (len(docs), sum(length for _, length, _ in docs)),
+            )
+            for term, _ in postings:
+                self._cache.pop(term, None)
+
+    # -- reads --------------------------------------------------------------
+
+    def _rows(self, conn: sqlite3.Connection, node_ids: Sequence[str]) -> np.ndarray:
+        rows: List[int] = []
+        for start in range(0, len(node_ids), 500):
+            chunk = list(node_ids[start : start + 500])
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(
+                row for (row,) in conn.execute(f"SELECT row FROM bm25_docs WHERE node_id IN ({placeholders})", chunk)
+            )
+        return np.asarray(rows, dtype=np.int32)
+
+    def search(
+        self, query: str, top_k: int, node_ids: Optional[Sequence[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """The `top_k` (node_id, score) pairs for `query`, best first, optionally only among `node_ids`."""
+        terms = set(tokenize(query))
+        if not terms or top_k <= 0 or (node_ids is not None and not node_ids):
+            return []
+        with self._connection() as conn:
+            docs, total_length = conn.execute("SELECT docs, total_length FROM bm25_stats").fetchone()
+            if not docs:
+                return []
+            avg_length = total_length / docs
+            allowed = self._rows(conn, node_ids) if node_ids is not None else None
+            rows, scores = [], []
+            for term in terms:
+                postings = self._postings(conn, term)
+                # Document frequency stays corpus-wide so scores do not depend on the filter
+                df = len(postings)
+                if allowed is not None:
+                    postings = postings[np.isin(postings["row"], allowed)]
+                if not len(postings):
+                    continue
+                idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+                tf = postings["tf"].astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * postings["length"] / avg_length)
+                rows.append(postings["row"])
+                scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+            if not rows:
+                return []
+            unique_rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+            totals = np.bincount(inverse, weights=np.concatenate(scores))
+            k = min(top_k, len(totals))
+            top = np.argpartition(-totals, k - 1)[:k]
+            top = top[np.argsort(-totals[top])]
+            top_rows = unique_rows[top].tolist()
+            placeholders = ",".join("?" * len(top_rows))
+            node_ids = dict(
+                conn.execute(f"SELECT row, node_id FROM bm25_docs WHERE row IN ({placeholders})", top_rows)
+            )
+        return [(node_ids[row], float(score)) for row, score in zip(top_rows, totals[top].tolist())]
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# llama_index is imported on first use, so the chat router loads without it
+# and the server can start accepting connections before the index warm-up
+if TYPE_CHECKING:
+    from llama_index.core.llms.llm import LLM
+
+_ROLE_NAMES = {"user": "User", "assistant": "Assistant"}
+
+
+def _format_messages(messages: List[Tuple[str, str]]) -> str:
+    return "\n".join(f"{_ROLE_NAMES.get(role, role)}: {content}" for role, content in messages)
+
+
+class ConversationMemory:
+    """
+    One conversation's rolling summary plus the recent messages it does not cover yet.
+
+    Prompts only ever see the summary and the newest messages that fit the
+    token budget, so their size stays flat however long the conversation runs.
+    """
+
+    def __init__(self, owner: "ChatMemory") -> None:
+        self._owner = owner
+        self.summary = ""
+        self.messages: List[Tuple[str, str]] = []
+        self._tokens: List[int] = []
+        self._compaction: Optional[asyncio.Task] = None
+        # Id of the newest stored message it was loaded from, and the messages this worker
+        # has stored for it since; more stored than that means another worker added turns
+        self.stored_through = 0
+        self.recorded = 0
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.messages
+
+    def _append(self, role: str, content: str) -> None:
+        from llama_index.core.settings import Settings
+
+        self.messages.append((role, content))
+        self._tokens.append(len(Settings.tokenizer(content)))
+
+    def _recent(self) -> List[Tuple[str, str]]:
+        budget = self._owner.token_budget
+        start = len(self.messages)
+        while start > 0 and self._tokens[start - 1] <= budget:
+            budget -= self._tokens[start - 1]
+            start -= 1
+        return self.messages[start:]
+
+    async def condense(self, question: str) -> str:
+        """`question` rewritten to stand on its own, for retrieval and caching."""
+        if self.empty:
+            return question
+        from llama_index.core.prompts import PromptTemplate
+        from prompts.chat_prompts import CONDENSE_QUESTION_TMPL
+
+        try:
+            standalone = await self._owner.llm.apredict(
+                PromptTemplate(CONDENSE_QUESTION_TMPL),
+                summary_str=self.summary or "(none)",
+                history_str=_format_messages(self._recent()) or "(none)",
+                question_str=question,
+            )
+        except Exception as e:
+            logging.warning(f"Could not condense follow-up question, using it as is: {str(e)}")
+            return question
+        return standalone.strip() or question
+
+    def add_turn(self, question: str, answer: str) -> None:
+        # The question was counted when the turn started, in `ChatMemory.get`
+        self.recorded += 1
+        self._append("user", question)
+        self._append("assistant", answer)
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if sum(self._tokens) <= self._owner.token_budget:
+            return
+        if self._compaction is None or self._compaction.done():
+            self._compaction = asyncio.create_task(self._compact())
+
+    async def _compact(self) -> None:
+        # Fold the oldest messages in until the rest fit in half the budget, so the
+        # summary is rewritten once every few turns rather than on every turn
+        remaining = sum(self._tokens)
+        folded = 0
+        while folded < len(self.messages) and remaining > self._owner.token_budget // 2:
+            remaining -= self._tokens[folded]
+            folded += 1
+        from llama_index.core.prompts import PromptTemplate
+        from prompts.chat_prompts import SUMMARIZE_HISTORY_TMPL
+
+        try:
+            summary = await self._owner.llm.apredict(
+                PromptTemplate(SUMMARIZE_HISTORY_TMPL),
+                summary_str=self.summary or "(none)",
+                history_str=_format_messages(self.messages[:folded]),
+                max_words=str(self._owner.summary_tokens * 3 // 4),
+            )
+        except Exception as e:
+            logging.error(f"Failed to summarize conversation history: {str(e)}")
+            return
+        # Only appends happen meanwhile, so the folded messages are still the oldest
+        self.summary = summary.strip()
+        del self.messages[:folded]
+        del self._tokens[:folded]
+        logging.debug(f"Folded {folded} messages into the conversation summary")
+
+
+class ChatMemory:
+    """
+    Conversation memories for this worker, kept in an LRU of `max_conversations`.
+
+    A conversation that is not cached is rebuilt from its last `load_messages`
+    stored messages through `loader(user_id, conversation_id)`; concurrent
+    requests for it share one load. With `counter`, a cached conversation is
+    checked against the store on every use and rebuilt if other workers have
+    added turns to it.
+
+    Args:
+        loader: coroutine returning the stored (role, content) messages, oldest first,
+            and the id of the newest one (0 if there are none)
+        counter: coroutine returning how many messages are stored in a conversation after a message id
+        token_budget (int): prompt tokens of recent messages before older ones are summarized
+        summary_tokens (int): target length of the rolling summary
+        max_conversations (int): conversations kept in memory
+        load_messages (int): stored messages read when a conversation is not cached
+        llm (Optional[LLM]): LLM for condensing and summarizing; defaults to Settings.llm
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[int, str], Awaitable[Tuple[List[Tuple[str, str]], int]]],
+        counter: Optional[Callable[[str, int], Awaitable[int]]] = None,
+        token_budget: int = 1500,
+        summary_tokens: int = 300,
+        max_conversations: int = 10000,
+        load_messages: int = 50,
+        llm: Optional["LLM"] = None,
+    ) -> None:
+        self._loader = loader
+        self._counter = counter
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.max_conversations = max_conversations
+        self.load_messages = load_messages
+        self._llm = llm
+        self._memories: "OrderedDict[Tuple[int, str], ConversationMemory]" = OrderedDict()
+        self._loading: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    @property
+    def llm(self) -> "LLM":
+        from llama_index.core.settings import Settings
+
+        return self._llm or Settings.llm
+
+    async def get(self, user_id: int, conversation_id: str, load: bool = True) -> ConversationMemory:
+        """
+        The memory of `conversation_id`; pass `load=False` for a conversation that was just started.
+
+        Each call starts a turn: the caller stores the question it was asked next.
+        """
+        key = (user_id, conversation_id)
+        memory = self._memories.get(key)
+        if memory is not None and self._counter is not None:
+            stored = await self._counter(conversation_id, memory.stored_through)
+            if stored > memory.recorded:
+                logging.debug(f"Conversation {conversation_id} has turns from other workers, reloading it")
+                if self._memories.get(key) is memory:
+                    del self._memories[key]
+                memory, load = None, True
+        if memory is not None:
+            self._memories.move_to_end(key)
+        else:
+            memory = await self._load(key, load)
+        memory.recorded += 1
+        return memory
+
+    async def _load(self, key: Tuple[int, str], load: bool) -> ConversationMemory:
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(key, load))
+            self._loading[key] = task
+            task.add_done_callback(lambda done: self._loading.pop(key) if self._loading.get(key) is done else None)
+        # Shielded: a request that goes away must not cancel the load for the others
+        return await asyncio.shield(task)
+
+    async def _build(self, key: Tuple[int, str], load: bool) -> ConversationMemory:
+        memory = ConversationMemory(self)
+        if load:
+            messages, memory.stored_through = await self._loader(*key)
+            for role, content in messages:
+                memory._append(role, content)
+            memory._maybe_compact()
+        self._memories[key] = memory
+        while len(self._memories) > self.max_conversations:
+            self._memories.popitem(last=False)
+        return memory
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Optional
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot get a slot; maps to HTTP 429."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("Server is busy, retry later")
+        self.retry_after = retry_after
+
+
+class Permit:
+    """A held slot. `release()` is idempotent so both the stream and its cleanup can call it."""
+
+    def __init__(self, limiter: "ConcurrencyLimiter") -> None:
+        self._limiter = limiter
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter._semaphore.release()
+
+
+class ConcurrencyLimiter:
+    """
+    Per-worker limit on concurrent requests with a bounded wait queue.
+
+    Up to `max_concurrency` requests run at once and up to `max_queue` more wait
+    for a slot, each for at most `queue_timeout` seconds. Anything beyond that is
+    rejected immediately with `Overloaded` so clients back off instead of piling up.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.max_concurrency - self._semaphore._value
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    async def acquire(self, timeout: Optional[float] = None) -> Permit:
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            logging.warning(f"Rejecting request: {self.in_flight} in flight, {self._waiting} queued")
+            raise Overloaded(retry_after=self.queue_timeout)
+        self._waiting += 1
+        # Not wait_for: on Python <= 3.11 it can time out just as the acquire succeeds and
+        # lose that permit. The acquire runs as its own task and is settled here either way.
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            await asyncio.wait((acquire,), timeout=timeout or self.queue_timeout)
+        except BaseException:
+            # The caller was cancelled; give back a permit that was granted meanwhile
+            if acquire.done() and not acquire.cancelled():
+                self._semaphore.release()
+            acquire.cancel()
+            raise
+        finally:
+            self._waiting -= 1
+        if not acquire.done():
+            # Cancelling a pending acquire hands any permit it was just given to the next waiter
+            acquire.cancel()
+            raise Overloaded(retry_after=self.queue_timeout)
+        return Permit(self)
@@ -0,0 +1,155 @@
+import logging
+import re
+from typing import Dict, FrozenSet, List, Optional
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.settings import Settings
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _has_span(node: BaseNode) -> bool:
+    """Whether the node's character offsets describe exactly its text."""
+    return (
+        isinstance(node, TextNode)
+        and node.start_char_idx is not None
+        and node.end_char_idx is not None
+        and node.end_char_idx - node.start_char_idx == len(node.text)
+    )
+
+
+def _score(node: NodeWithScore) -> float:
+    return node.score if node.score is not None else 0.0
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Trims retrieved nodes to the context the synthesizer needs.
+
+    Chunks of the same source that overlap or touch are merged into one node
+    with the overlap written once, near-duplicates (such as the same invoice
+    template retrieved from several files) are dropped, and what remains is
+    packed by score into `token_budget` prompt tokens.
+
+    Args:
+        token_budget (int): maximum prompt tokens of node content, metadata included
+        duplicate_threshold (float): word-shingle Jaccard similarity at which a
+            lower-scored node counts as a duplicate
+        shingle_size (int): words per shingle
+    """
+
+    token_budget: int = Field(
+        default=3000,
+        description="The maximum prompt tokens of node content, metadata included.",
+        gt=0,
+    )
+    duplicate_threshold: float = Field(
+        default=0.9,
+        description="The shingle similarity at which a lower-scored node is dropped as a duplicate.",
+        gt=0,
+        le=1,
+    )
+    shingle_size: int = Field(
+        default=3,
+        description="The number of words per shingle.",
+        gt=0,
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    # -- merging ------------------------------------------------------------
+
+    def _join(self, run: List[NodeWithScore], text: str, end: int) -> NodeWithScore:
+        if len(run) == 1:
+            return run[0]
+        # The merged node keeps the id and metadata of its best-scoring chunk
+        best = max(run, key=_score)
+        node = best.node.model_copy(
+            update={"text": text, "start_char_idx": run[0].node.start_char_idx, "end_char_idx": end}
+        )
+        return NodeWithScore(node=node, score=best.score)
+
+    def _merge(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        groups: Dict[str, List[NodeWithScore]] = {}
+        for node in nodes:
+            groups.setdefault(node.node.ref_doc_id or node.node.node_id, []).append(node)
+
+        merged: List[NodeWithScore] = []
+        for group in groups.values():
+            merged.extend(node for node in group if not _has_span(node.node))
+            spans = sorted(
+                (node for node in group if _has_span(node.node)), key=lambda node: node.node.start_char_idx
+            )
+            run: List[NodeWithScore] = []
+            text, start = "", 0
+            for item in spans:
+                node = item.node
+                # `text` is the source from `start` to the end of the run, so the part
+                # shared with this chunk must read the same in both
+                offset = node.start_char_idx - start
+                shared = len(text) - offset
+                if run and shared >= 0 and text[offset : offset + len(node.text)] == node.text[:shared]:
+                    run.append(item)
+                    text += node.text[shared:]
+                    continue
+                if run:
+                    merged.append(self._join(run, text, start + len(text)))
+                run, text, start = [item], node.text, node.start_char_idx
+            if run:
+                merged.append(self._join(run, text, start + len(text)))
+        return merged
+
+    # -- near-duplicates ----------------------------------------------------
+
+    def _shingles(self, text: str) -> FrozenSet[str]:
+        words = _WORD_RE.findall(text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        return frozenset(" ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1)))
+
+    def _dedupe(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        kept: List[NodeWithScore] = []
+        kept_shingles: List[FrozenSet[str]] = []
+        for node in sorted(nodes, key=_score, reverse=True):
+            shingles = self._shingles(node.node.get_content(metadata_mode=MetadataMode.NONE))
+            if any(
+                len(shingles & other) >= self.duplicate_threshold * len(shingles | other)
+                for other in kept_shingles
+            ):
+                continue
+            kept.append(node)
+            kept_shingles.append(shingles)
+        return kept
+
+    # -- packing ------------------------------------------------------------
+
+    def _pack(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        packed: List[NodeWithScore] = []
+        remaining = self.token_budget
+        for node in nodes:
+            tokens = len(Settings.tokenizer(node.node.get_content(metadata_mode=MetadataMode.LLM)))
+            # The best node always goes in, even when it alone is over budget
+            if tokens <= remaining or not packed:
+                packed.append(node)
+                remaining -= tokens
+        return packed
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        merged = self._merge(nodes)
+        unique = self._dedupe(merged)
+        packed = self._pack(unique)
+        logging.debug(
+            f"Context packed {len(nodes)} nodes into {len(packed)} "
+            f"({len(nodes) - len(merged)} merged, {len(merged) - len(unique)} duplicates, "
+            f"{len(unique) - len(packed)} over budget)"
+        )
+        return packed
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.conversation import Conversation, ConversationMessage
+
+
+class _PendingMessage(NamedTuple):
+    seq: int
+    conversation_id: str
+    user_id: int
+    role: str
+    content: str
+    created_at: datetime
+
+
+class ConversationStore:
+    """
+    Chat history with write-behind persistence.
+
+    `record` only enqueues, so the SSE path never waits on the database. A
+    background task drains whatever has queued up (at most `batch_size`
+    messages) and writes it in one transaction, so batches grow with load
+    instead of waiting on a timer. When the queue is full new messages are
+    dropped with a warning rather than slowing down chat.
+
+    Messages are numbered as they are recorded, so a reader can wait for just
+    one user's earlier writes with `flush(user_id)` rather than for the queue
+    to empty, which under steady traffic it may never do.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        batch_size: int = 200,
+        max_queue: int = 10000,
+    ) -> None:
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self._queue: "asyncio.Queue[_PendingMessage]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        # Sequence numbers of the last message recorded, overall and per user, and of the last one written
+        self._recorded = 0
+        self._recorded_by_user: Dict[int, int] = {}
+        self._written = 0
+        self._progress = asyncio.Event()
+
+    def record(self, conversation_id: str, user_id: int, role: str, content: str) -> None:
+        message = _PendingMessage(self._recorded + 1, conversation_id, user_id, role, content, datetime.utcnow())
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logging.warning(f"Conversation store queue is full, dropping {role} message for {conversation_id}")
+            return
+        self._recorded = message.seq
+        self._recorded_by_user[user_id] = message.seq
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def flush(self, user_id: Optional[int] = None) -> None:
+        """Wait until what was recorded before this call (only for `user_id`, if given) has been written."""
+        target = self._recorded if user_id is None else self._recorded_by_user.get(user_id, 0)
+        while self._task is not None and self._written < target:
+            await self._progress.wait()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._write(batch)
+                logging.debug(f"Persisted {len(batch)} chat messages")
+            except IntegrityError as e:
+                # Typically another worker created one of these conversations at the same time;
+                # written one by one, only the messages that really conflict are lost
+                logging.warning(f"Chat message batch conflicted, writing {len(batch)} messages one by one: {str(e)}")
+                await self._write_each(batch)
+            except Exception as e:
+                logging.error(f"Failed to persist {len(batch)} chat messages: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                self._advance(batch[-1].seq)
+
+    def _advance(self, seq: int) -> None:
+        self._written = seq
+        for user_id in [user_id for user_id, last in self._recorded_by_user.items() if last <= seq]:
+            del self._recorded_by_user[user_id]
+        progress, self._progress = self._progress, asyncio.Event()
+        progress.set()
+
+    async def _write_each(self, batch: List[_PendingMessage]) -> None:
+        for message in batch:
+            try:
+                await self._write([message])
+            except Exception as e:
+                logging.error(f"Failed to persist {message.role} message for {message.conversation_id}: {str(e)}")
+
+    async def _write(self, batch: List[_PendingMessage]) -> None:
+        conversation_ids = {message.conversation_id for message in batch}
+        async with self._session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    select(Conversation.id, Conversation.user_id).where(Conversation.id.in_(conversation_ids))
+                )
+                owners: Dict[str, int] = dict(result.all())
+                rows = []
+                for message in batch:
+                    owner = owners.get(message.conversation_id)
+                    if owner is None:
+                        session.add(
+                            Conversation(
+                                id=message.conversation_id,
+                                user_id=message.user_id,
+                                title=message.content[:80],
+                                created_at=message.created_at,
+                                updated_at=message.created_at,
+                            )
+                        )
+                        owners[message.conversation_id] = owner = message.user_id
+                    if owner != message.user_id:
+                        # Ids come from clients; never write into someone else's conversation
+                        logging.warning(f"User {message.user_id} cannot write to conversation {message.conversation_id}")
+                        continue
+                    rows.append(
+                        {
+                            "conversation_id": message.conversation_id,
+                            "role": message.role,
+                            "content": message.content,
+                            "created_at": message.created_at,
+                        }
+                    )
+                await session.flush()
+                if rows:
+                    await session.execute(insert(ConversationMessage), rows)
+                    latest: Dict[str, datetime] = {}
+                    for row in rows:
+                        latest[row["conversation_id"]] = row["created_at"]
+                    for conversation_id, updated_at in latest.items():
+                        await session.execute(
+                            update(Conversation)
+                            .where(Conversation.id == conversation_id)
+                            .values(updated_at=updated_at)
+                        )
+
+    async def history(
+        self,
+        user_id: int,
+        conversation_id: Optional[str] = None,
+        before: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[Optional[str], List[ConversationMessage], Optional[int]]:
+        """
+        One page of a conversation, oldest message first.
+
+        Defaults to the user's most recently active conversation. Returns the
+        conversation id (None if there is nothing to show), the messages, and
+        the `before` cursor for the next older page, if there is one.
+        """
+        async with self._session_factory() as session:
+            query = select(Conversation.id).where(Conversation.user_id == user_id)
+            if conversation_id is None:
+                query = query.order_by(Conversation.updated_at.desc()).limit(1)
+            else:
+                query = query.where(Conversation.id == conversation_id)
+            conversation_id = (await session.execute(query)).scalar_one_or_none()
+            if conversation_id is None:
+                return None, [], None
+
+            query = select(ConversationMessage).where(ConversationMessage.conversation_id == conversation_id)
+            if before is not None:
+                query = query.where(ConversationMessage.id < before)
+            query = query.order_by(ConversationMessage.id.desc()).limit(limit + 1)
+            messages = list((await session.execute(query)).scalars())
+        next_before = messages[limit - 1].id if len(messages) > limit else None
+        return conversation_id, messages[:limit][::-1], next_before
+
+    async def count_after(self, conversation_id: str, after_id: int) -> int:
+        """Number of stored messages of `conversation_id` newer than message `after_id`."""
+        async with self._session_factory() as session:
+            return (
+                await session.execute(
+                    select(func.count())
+                    .select_from(ConversationMessage)
+                    .where(ConversationMessage.conversation_id == conversation_id, ConversationMessage.id > after_id)
+                )
+            ).scalar_one()
@@ -0,0 +1,19 @@
+import logging
+import os
+from dotenv import load_dotenv
+
+# Imported first by main, before any module reads its settings from the environment
+
+# Load environment variables
+ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
+
+if ENVIRONMENT == 'development':
+    load_dotenv()
+
+# Configure logging based on the environment
+if ENVIRONMENT == 'production':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+else:  # 'development' or any other environment
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+logging.info(f"Starting application in {ENVIRONMENT} environment")
@@ -0,0 +1,89 @@
+import asyncio
+from typing import Dict, List, Optional, Sequence
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from utils.bm25 import BM25Index
+from utils.storage import SqliteDocumentStore
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> Dict[str, float]:
+    """Sum of 1 / (k + rank) over every ranking a node id appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Vector and BM25 retrieval fused by reciprocal rank.
+
+    Exact tokens such as invoice numbers, vendor names and amounts are found
+    by the lexical ranking even when embeddings place them poorly, so fewer
+    fused results are needed than pure vector search would return.
+
+    Args:
+        vector_retriever (BaseRetriever): the index's vector retriever
+        docstore (SqliteDocumentStore): docstore holding the BM25 index and node text
+        similarity_top_k (int): number of fused results
+        lexical_top_k (int): number of BM25 candidates
+        rrf_k (int): rank offset; larger values flatten the head of each ranking
+        node_ids (Optional[List[str]]): restrict lexical scoring to these nodes; pass
+            the same list to the vector retriever
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        docstore: SqliteDocumentStore,
+        similarity_top_k: int = 6,
+        lexical_top_k: int = 10,
+        rrf_k: int = 60,
+        node_ids: Optional[List[str]] = None,
+    ) -> None:
+        super().__init__(callback_manager=vector_retriever.callback_manager)
+        self._vector_retriever = vector_retriever
+        self._docstore = docstore
+        self._bm25: BM25Index = docstore.bm25
+        self.similarity_top_k = similarity_top_k
+        self.lexical_top_k = lexical_top_k
+        self.rrf_k = rrf_k
+        self.node_ids = node_ids
+
+    def _lexical(self, query_bundle: QueryBundle) -> List[str]:
+        return [
+            node_id
+            for node_id, _ in self._bm25.search(query_bundle.query_str, self.lexical_top_k, node_ids=self.node_ids)
+        ]
+
+    def _fuse(self, vector_nodes: List[NodeWithScore], lexical_ids: List[str]) -> List[NodeWithScore]:
+        nodes = {node.node.node_id: node.node for node in vector_nodes}
+        missing = [node_id for node_id in lexical_ids if node_id not in nodes]
+        for node in self._docstore.get_nodes(missing, raise_error=False):
+            if node is not None:
+                nodes[node.node_id] = node
+        scores = reciprocal_rank_fusion(
+            [[node.node.node_id for node in vector_nodes], lexical_ids], k=self.rrf_k
+        )
+        ranked = sorted((node_id for node_id in scores if node_id in nodes), key=scores.get, reverse=True)
+        return [
+            NodeWithScore(node=nodes[node_id], score=scores[node_id])
+            for node_id in ranked[: self.similarity_top_k]
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._fuse(self._vector_retriever.retrieve(query_bundle), self._lexical(query_bundle))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # Both legs read nodes through the docstore's SQLite connection, whose lock a long
+        # postings scan can hold, so neither may wait for it on the event loop. The vector
+        # leg runs its sync path too: callers set query_bundle.embedding beforehand, so it
+        # does not call the embedding model.
+        vector_nodes, lexical_ids = await asyncio.gather(
+            asyncio.to_thread(self._vector_retriever.retrieve, query_bundle),
+            asyncio.to_thread(self._lexical, query_bundle),
+        )
+        return await asyncio.to_thread(self._fuse, vector_nodes, lexical_ids)
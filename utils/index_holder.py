@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+from llama_index.core import VectorStoreIndex
+
+from utils.manifest import list_document_files
+
+
+def documents_fingerprint(documents_dir: str) -> str:
+    """Cheap change marker for `documents_dir`: one `stat` per visible file."""
+    digest = hashlib.sha256()
+    for path in list_document_files(documents_dir):
+        stat = os.stat(path)
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class IndexHolder:
+    """
+    Process-wide holder for the live index.
+
+    Readers take the current index with `get()` and keep using that object for the
+    rest of their request. Refreshes build a new index off to the side and publish it
+    with a single reference assignment, so in-flight queries are never blocked or torn.
+
+    A refresh reloads when `fingerprint()` changes; by default that is a cheap
+    fingerprint of `documents_dir`.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Awaitable[VectorStoreIndex]],
+        documents_dir: str = "documents",
+        refresh_interval: float = 30.0,
+        fingerprint: Optional[Callable[[], Optional[str]]] = None,
+    ) -> None:
+        self._loader = loader
+        self.documents_dir = documents_dir
+        self.refresh_interval = refresh_interval
+        self._fingerprint_fn = fingerprint or (lambda: documents_fingerprint(self.documents_dir))
+        self.version = 0
+        self._index: Optional[VectorStoreIndex] = None
+        self._fingerprint: Optional[str] = None
+        self._refresh_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def get(self) -> VectorStoreIndex:
+        index = self._index
+        if index is None:
+            raise RuntimeError("Index has not been loaded yet")
+        return index
+
+    def _publish(self, index: VectorStoreIndex, fingerprint: str) -> None:
+        self._index = index
+        self._fingerprint = fingerprint
+        self.version += 1
+        logging.info(f"Published index version {self.version}")
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Reload the index if its fingerprint changed. Returns True if a new version was published."""
+        async with self._refresh_lock:
+            fingerprint = await asyncio.to_thread(self._fingerprint_fn)
+            if not force and self._index is not None and fingerprint == self._fingerprint:
+                return False
+            index = await self._loader(self.documents_dir)
+            self._publish(index, fingerprint)
+            return True
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Background index refresh failed: {str(e)}")
+
+    async def start(self) -> None:
+        """Load the index once and start the background refresher."""
+        await self.refresh(force=True)
+        if self.refresh_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._poll())
+            logging.info(f"Index refresher polling every {self.refresh_interval}s")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
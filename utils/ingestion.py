@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Type
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.schema import BaseNode, TransformComponent
+
+from utils.metrics import INGESTION_NODES_TOTAL, INGESTION_RATE_LIMITED_TOTAL, INGESTION_STAGE_SECONDS
+from utils.transform_cache import CachedTransformation
+
+INGEST_PARSE_WORKERS = int(os.getenv('INGEST_PARSE_WORKERS', str(os.cpu_count() or 1)))
+INGEST_PARSE_BATCH_SIZE = int(os.getenv('INGEST_PARSE_BATCH_SIZE', '16'))
+# Upstream (LLM and embedding) calls in flight during enrichment, counted per call rather than per job
+INGEST_MAX_CONCURRENCY = int(os.getenv('INGEST_MAX_CONCURRENCY', '8'))
+INGEST_MAX_RETRIES = int(os.getenv('INGEST_MAX_RETRIES', '6'))
+# Files loaded, enriched and committed to the index per checkpoint; bounds peak memory
+INGEST_BATCH_FILES = int(os.getenv('INGEST_BATCH_FILES', '64'))
+
+# Splitter settings that are rebuilt in each worker rather than pickled
+_SPLITTER_UNPICKLABLE = {"id_func", "callback_manager", "class_name"}
+
+
+def _load_and_split(
+    input_files: List[str], splitter_cls: Type[NodeParser], splitter_kwargs: Dict[str, Any]
+) -> Tuple[List[str], List[BaseNode]]:
+    """Parse and chunk a batch of files. Runs in a worker process."""
+    documents = SimpleDirectoryReader(input_files=input_files, filename_as_id=True).load_data()
+    splitter = splitter_cls(**splitter_kwargs)
+    return [doc.id_ for doc in documents], splitter.get_nodes_from_documents(documents)
+
+
+def _stage_name(transformation: TransformComponent) -> str:
+    if isinstance(transformation, CachedTransformation):
+        transformation = transformation.transformation
+    return type(transformation).__name__
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError" or "rate limit" in str(error).lower()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _CallLimiter:
+    """Like a semaphore, but a holder can take several slots at once."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = max(limit, 1)
+        self._available = self.limit
+        self._changed = asyncio.Condition()
+
+    @asynccontextmanager
+    async def hold(self, slots: int) -> AsyncIterator[None]:
+        # A job wider than the whole limit waits until it has every slot
+        slots = min(max(slots, 1), self.limit)
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._available >= slots)
+            self._available -= slots
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self._available += slots
+                self._changed.notify_all()
+
+
+class IngestionEngine:
+    """
+    Parallel ingestion for a pipeline of `[node_parser, *enrichments]`.
+
+    Files are loaded and chunked across a process pool that lives as long as the
+    engine, so every batch of a run reuses the same workers; call `shutdown` when
+    done. Enrichment runs stage by stage through the transformations' async path,
+    with each stage fanned out into jobs of whole documents, roughly one upstream
+    call each. Jobs take slots from a shared `_CallLimiter`, one per upstream
+    call they can have open at once (see `_fanout`), so at most `max_concurrency`
+    calls are in flight however the transformations fan out internally. A
+    rate-limit response pauses every job until the shared cooldown passes
+    before retrying with backoff.
+    """
+
+    def __init__(
+        self,
+        pipeline: IngestionPipeline,
+        parse_workers: int = INGEST_PARSE_WORKERS,
+        parse_batch_size: int = INGEST_PARSE_BATCH_SIZE,
+        max_concurrency: int = INGEST_MAX_CONCURRENCY,
+        max_retries: int = INGEST_MAX_RETRIES,
+    ) -> None:
+        splitter, *enrichments = pipeline.transformations
+        if not isinstance(splitter, NodeParser):
+            raise ValueError("The first pipeline transformation must be a node parser")
+        self.splitter = splitter
+        self.enrichments: List[TransformComponent] = enrichments
+        self.parse_workers = parse_workers
+        self.parse_batch_size = parse_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._cooldown_until = 0.0
+        # Workers are only spawned when the first batch is submitted
+        self._pool = self._new_pool() if parse_workers > 1 else None
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the serving process has live threads and event loops
+        return ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _parse(self, input_files: List[str]) -> Tuple[List[str], List[BaseNode]]:
+        batches = [
+            input_files[i : i + self.parse_batch_size]
+            for i in range(0, len(input_files), self.parse_batch_size)
+        ]
+        splitter_cls = type(self.splitter)
+        splitter_kwargs = {
+            k: v for k, v in self.splitter.model_dump().items() if k not in _SPLITTER_UNPICKLABLE
+        }
+        if len(batches) <= 1 or self._pool is None:
+            results = [await asyncio.to_thread(_load_and_split, batch, splitter_cls, splitter_kwargs) for batch in batches]
+        else:
+            loop = asyncio.get_running_loop()
+            pool = self._pool
+            try:
+                results = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(pool, _load_and_split, batch, splitter_cls, splitter_kwargs)
+                        for batch in batches
+                    )
+                )
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool for the next run
+                if self._pool is pool:
+                    self._pool = self._new_pool()
+                raise
+        doc_ids = [doc_id for ids, _ in results for doc_id in ids]
+        nodes = [node for _, batch_nodes in results for node in batch_nodes]
+        return doc_ids, nodes
+
+    def _jobs(self, transformation: TransformComponent, nodes: Sequence[BaseNode]) -> List[List[BaseNode]]:
+        """
+        Split a stage into batches of roughly one upstream call each.
+
+        A document's nodes always go to the same job, so document-level extractors
+        see all of them and each document keeps its own transform cache entry.
+        Documents larger than one call get a job to themselves.
+        """
+        inner = transformation.transformation if isinstance(transformation, CachedTransformation) else transformation
+        if isinstance(inner, BaseEmbedding):
+            size = inner.embed_batch_size
+        else:
+            size = getattr(inner, "nodes_per_call", 1)
+        documents: Dict[str, List[BaseNode]] = {}
+        for node in nodes:
+            documents.setdefault(node.ref_doc_id or node.node_id, []).append(node)
+        jobs: List[List[BaseNode]] = []
+        current: List[BaseNode] = []
+        for document in documents.values():
+            if current and len(current) + len(document) > size:
+                jobs.append(current)
+                current = []
+            current.extend(document)
+        if current:
+            jobs.append(current)
+        return jobs
+
+    def _fanout(self, transformation: TransformComponent, nodes: Sequence[BaseNode]) -> int:
+        """Most upstream calls a job over `nodes` can have open at once."""
+        inner = transformation.transformation if isinstance(transformation, CachedTransformation) else transformation
+        workers = getattr(inner, "num_workers", None)
+        if isinstance(inner, BaseEmbedding):
+            # Batches are gathered all at once unless num_workers > 1 caps them
+            calls = -(-len(nodes) // inner.embed_batch_size)
+            return min(calls, workers) if workers and workers > 1 else calls
+        # Extractors make at most one call per node, num_workers at a time
+        return min(len(nodes), workers or 1)
+
+    async def _call(self, transformation: TransformComponent, nodes: List[BaseNode], limiter: _CallLimiter) -> Sequence[BaseNode]:
+        for attempt in range(self.max_retries + 1):
+            async with limiter.hold(self._fanout(transformation, nodes)):
+                delay = self._cooldown_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    return await transformation.acall(nodes)
+                except Exception as e:
+                    if not _is_rate_limited(e) or attempt == self.max_retries:
+                        raise
+                    backoff = _retry_after(e) or min(60.0, 2 ** attempt) * (1 + random.random())
+                    self._cooldown_until = max(self._cooldown_until, time.monotonic() + backoff)
+                    stage = _stage_name(transformation)
+                    INGESTION_RATE_LIMITED_TOTAL.inc(stage=stage)
+                    logging.warning(f"Rate limited in {stage}; retrying in {backoff:.1f}s")
+        raise RuntimeError("unreachable")
+
+    async def arun(self, input_files: List[str]) -> Tuple[List[str], List[BaseNode]]:
+        """Ingest `input_files`. Returns the loaded document ids and the enriched nodes."""
+        if not input_files:
+            return [], []
+        started = time.perf_counter()
+        doc_ids, nodes = await self._parse(input_files)
+        elapsed = time.perf_counter() - started
+        INGESTION_STAGE_SECONDS.observe(elapsed, stage="parse")
+        INGESTION_NODES_TOTAL.inc(len(nodes), stage="parse")
+        logging.debug(f"Parsed {len(input_files)} files into {len(nodes)} nodes in {elapsed:.2f}s")
+        limiter = _CallLimiter(self.max_concurrency)
+        for transformation in self.enrichments:
+            stage_started = time.perf_counter()
+            results = await asyncio.gather(
+                *(self._call(transformation, batch, limiter) for batch in self._jobs(transformation, nodes))
+            )
+            nodes = [node for batch in results for node in batch]
+            stage = _stage_name(transformation)
+            elapsed = time.perf_counter() - stage_started
+            INGESTION_STAGE_SECONDS.observe(elapsed, stage=stage)
+            INGESTION_NODES_TOTAL.inc(len(nodes), stage=stage)
+            logging.debug(f"{stage} stage took {elapsed:.2f}s")
+        logging.info(
+            f"Ingested {len(input_files)} files into {len(nodes)} nodes in {time.perf_counter() - started:.2f}s"
+        )
+        return doc_ids, nodes
+
+    def run(self, input_files: List[str]) -> Tuple[List[str], List[BaseNode]]:
+        """Blocking entry point with a private event loop; call from a worker thread."""
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.arun(input_files))
+        finally:
+            # A failed stage leaves sibling jobs running; cancel them before closing
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.ingestion_job import IngestionJob
+
+# Uploads wait here until their job runs; hidden, so neither the document manifest
+# nor the index refresher sees a file before its job moves it into place
+UPLOAD_DIR_NAME = ".uploads"
+
+
+def upload_path(documents_dir: str, job_id: str) -> str:
+    return os.path.join(documents_dir, UPLOAD_DIR_NAME, job_id)
+
+
+class IngestionJobQueue:
+    """
+    Persistent queue of uploaded documents waiting to be ingested.
+
+    Jobs are rows in the database and their files sit in `documents/.uploads/`,
+    so both survive restarts; jobs that were running when the process stopped
+    are queued again by `start`. A single drain task claims up to `batch_size`
+    queued jobs at a time, moves their files into `documents/` and calls
+    `ingest(paths)`, which brings the index up to date with the directory.
+    A failed run is retried until a job has had `max_attempts`.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        ingest: Callable[[List[str]], Awaitable[None]],
+        documents_dir: str = "documents",
+        batch_size: int = 16,
+        max_attempts: int = 3,
+        poll_interval: float = 5.0,
+    ) -> None:
+        self._session_factory = session_factory
+        self._ingest = ingest
+        self.documents_dir = documents_dir
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def enqueue(self, job_id: str, user_id: int, filename: str, document: str, size: int) -> IngestionJob:
+        """
+        Record a job for the file already written to `upload_path(documents_dir, job_id)`.
+        It is ingested as `documents_dir/document`.
+        """
+        job = IngestionJob(
+            id=job_id,
+            user_id=user_id,
+            filename=filename,
+            document=document,
+            size=size,
+            status="queued",
+            attempts=0,
+            created_at=datetime.utcnow(),
+        )
+        async with self._session_factory() as session:
+            async with session.begin():
+                session.add(job)
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str, user_id: int) -> Optional[IngestionJob]:
+        async with self._session_factory() as session:
+            return (
+                await session.execute(
+                    select(IngestionJob).where(IngestionJob.id == job_id, IngestionJob.user_id == user_id)
+                )
+            ).scalar_one_or_none()
+
+    async def position(self, job: IngestionJob) -> Optional[int]:
+        if job.status != "queued":
+            return None
+        async with self._session_factory() as session:
+            return (
+                await session.execute(
+                    select(func.count())
+                    .select_from(IngestionJob)
+                    .where(IngestionJob.status == "queued", IngestionJob.created_at < job.created_at)
+                )
+            ).scalar_one()
+
+    async def recover(self) -> None:
+        """Queue again the jobs a stopped process left running."""
+        async with self._session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    update(IngestionJob).where(IngestionJob.status == "running").values(status="queued")
+                )
+        if result.rowcount:
+            logging.info(f"Re-queued {result.rowcount} interrupted ingestion jobs")
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.recover()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logging.error(f"Ingestion job queue failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> int:
+        """Run queued jobs batch by batch until none are left. Returns the number of jobs run."""
+        total = 0
+        while True:
+            jobs = await self._claim()
+            if not jobs:
+                return total
+            total += len(jobs)
+            await self._process(jobs)
+
+    async def _claim(self) -> List[IngestionJob]:
+        async with self._session_factory() as session:
+            async with session.begin():
+                jobs = list(
+                    (
+                        await session.execute(
+                            select(IngestionJob)
+                            .where(IngestionJob.status == "queued")
+                            .order_by(IngestionJob.created_at)
+                            .limit(self.batch_size)
+                        )
+                    ).scalars()
+                )
+                now = datetime.utcnow()
+                for job in jobs:
+                    job.status = "running"
+                    job.started_at = now
+                    job.attempts += 1
+        return jobs
+
+    def _place(self, job: IngestionJob) -> str:
+        path = os.path.join(self.documents_dir, job.document)
+        staged = upload_path(self.documents_dir, job.id)
+        if os.path.exists(staged):
+            # A link fails rather than replacing a document that is already there
+            try:
+                os.link(staged, path)
+            except FileExistsError:
+                if not os.path.samefile(staged, path):
+                    raise
+            os.remove(staged)
+        elif not os.path.exists(path):
+            # Placed by an earlier attempt otherwise
+            raise FileNotFoundError(f"Uploaded file for job {job.id} is missing")
+        return path
+
+    async def _process(self, jobs: List[IngestionJob]) -> None:
+        placed, failed = [], {}
+        for job in jobs:
+            try:
+                placed.append((job, self._place(job)))
+            except OSError as e:
+                failed[job.id] = str(e)
+        error = None
+        if placed:
+            logging.info(f"Ingesting {len(placed)} uploaded documents")
+            try:
+                await self._ingest([path for _, path in placed])
+            except Exception as e:
+                logging.error(f"Ingesting uploaded documents failed: {str(e)}")
+                error = str(e)
+        await self._finish(jobs, failed, error)
+
+    async def _finish(self, jobs: List[IngestionJob], failed: dict, batch_error: Optional[str]) -> None:
+        now = datetime.utcnow()
+        async with self._session_factory() as session:
+            async with session.begin():
+                for job in jobs:
+                    error = failed.get(job.id, batch_error)
+                    if error is None:
+                        values = {"status": "done", "error": None, "finished_at": now}
+                    elif job.id not in failed and job.attempts < self.max_attempts:
+                        values = {"status": "queued", "error": error}
+                    else:
+                        values = {"status": "failed", "error": error, "finished_at": now}
+                    await session.execute(update(IngestionJob).where(IngestionJob.id == job.id).values(**values))
+        if batch_error is not None:
+            # Give a failing upstream a moment before the retried jobs run again
+            await asyncio.sleep(self.poll_interval)
@@ -1,43 +1,108 @@
+from utils.environment import ENVIRONMENT  # loads .env before the settings below are read
 from llama_index.core import (
-    SimpleDirectoryReader,
     VectorStoreIndex,
-    StorageContext,
-    load_index_from_storage,
     Settings,
     get_response_synthesizer
 )
 from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.core.retrievers import VectorIndexRetriever
+from llama_index.core.schema import QueryBundle
+from llama_index.core.vector_stores.types import MetadataFilters
 from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.extractors import TitleExtractor, QuestionsAnsweredExtractor
 from extractors.compliance_checker import ComplianceChecker, COMPLIANCE_CHECKER_TMPL
+from extractors.invoice_enrichment import InvoiceEnrichmentExtractor
+from utils.answer_cache import AnswerCache
+from utils.chat_memory import ConversationMemory
+from utils.context_packer import ContextPacker
+from utils.hybrid_retriever import HybridRetriever
+from utils.index_holder import IndexHolder
+from utils.ingestion import INGEST_BATCH_FILES, IngestionEngine
+from utils.manifest import DocumentManifest, doc_ids_by_file
+from utils import metrics
+from utils.metrics import CHAT_STAGE_SECONDS, CHAT_TIME_TO_FIRST_TOKEN_SECONDS, CHAT_TOKENS_PER_SECOND
+from utils.model_provider import create_models
+from utils.query_embedder import QueryEmbedder
+from utils.snapshots import SnapshotStore
+from utils.sse import FlushPolicy, SSEEncoder
+from utils.storage import load_index, open_storage_context, storage_exists
+from utils.transform_cache import CachedTransformation, TransformationCache
+from utils.vector_store import NumpyVectorStore
+from typing import Callable, Optional
+import asyncio
 import os
-from dotenv import load_dotenv
+import time
 import logging
-import json
-
-# Load environment variables
-ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
-
-if ENVIRONMENT == 'development':
-    load_dotenv()
 
 # Set up OpenAI API key
 openai_api_key = os.getenv('OPENAI_API_KEY', 'default_dev_key')
 
-# Configure logging based on the environment
-if ENVIRONMENT == 'production':
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-else:  # 'development' or any other environment
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# SSE framing: 'token', 'line' or 'coalesce' (by byte count or delay, whichever comes first)
+SSE_FLUSH_POLICY = FlushPolicy(os.getenv('SSE_FLUSH_POLICY', 'line'))
+SSE_COALESCE_BYTES = int(os.getenv('SSE_COALESCE_BYTES', '512'))
+SSE_COALESCE_MS = float(os.getenv('SSE_COALESCE_MS', '50'))
+
+# Answer cache; set ANSWER_CACHE_SIMILARITY (e.g. 0.95) to also match semantically similar queries
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1024'))
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY')) if os.getenv('ANSWER_CACHE_SIMILARITY') else None
+
+# Vector search: 'exact' (one matrix-vector product) or 'ivf' (approximate, tune nprobe for recall)
+VECTOR_STORE_KWARGS = {
+    "mode": os.getenv('VECTOR_STORE_MODE', 'exact'),
+    "nlist": int(os.getenv('VECTOR_STORE_NLIST', '0')),
+    "nprobe": int(os.getenv('VECTOR_STORE_NPROBE', '8')),
+}
 
-logging.info(f"Starting application in {ENVIRONMENT} environment")
+# Retrieval: 'hybrid' fuses vector and BM25 rankings, 'vector' is embedding similarity only.
+# RETRIEVAL_CANDIDATES results come from each ranking and RETRIEVAL_TOP_K go to synthesis
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '6'))
+RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', '10'))
+
+# Retrieved chunks are merged, deduplicated and packed into this many prompt tokens before synthesis
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.9'))
+context_packer = ContextPacker(token_budget=CONTEXT_TOKEN_BUDGET, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD)
+
+# Configure LlamaIndex Settings. MODEL_PROVIDER=fake swaps in deterministic local models
+# (see FAKE_* below) for benchmarks and offline development
+MODEL_PROVIDER = os.getenv('MODEL_PROVIDER', 'openai')
+Settings.llm, Settings.embed_model = create_models(
+    MODEL_PROVIDER,
+    api_key=openai_api_key,
+    output_tokens=int(os.getenv('FAKE_LLM_OUTPUT_TOKENS', '64')),
+    first_token_latency=float(os.getenv('FAKE_LLM_TTFT_MS', '300')) / 1000,
+    tokens_per_second=float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', '80')),
+    embed_dim=int(os.getenv('FAKE_EMBED_DIM', '256')),
+    embed_latency=float(os.getenv('FAKE_EMBED_LATENCY_MS', '50')) / 1000,
+)
 
-# Configure LlamaIndex Settings
-Settings.llm = OpenAI(model="gpt-4o-mini", api_key=openai_api_key)
-Settings.embed_model = OpenAIEmbedding(model="text-embedding-3-small", api_key=openai_api_key)
+# Chat queries are embedded through a per-worker cache that also batches concurrent misses
+# into one upstream request; QUERY_EMBED_BATCH_SIZE=1 turns batching off for models whose
+# query and document embeddings differ
+query_embedder = QueryEmbedder(
+    Settings.embed_model,
+    max_entries=int(os.getenv('QUERY_EMBED_CACHE_SIZE', '4096')),
+    batch_size=int(os.getenv('QUERY_EMBED_BATCH_SIZE', '32')),
+    window=float(os.getenv('QUERY_EMBED_WINDOW_MS', '5')) / 1000,
+)
+metrics.callback_counter(
+    "query_embedding_lookups_total",
+    "Query embedding lookups by result; 'coalesced' misses joined one already in flight.",
+    lambda: {
+        ("hit",): query_embedder.hits,
+        ("miss",): query_embedder.misses,
+        ("coalesced",): query_embedder.coalesced,
+    },
+    labels=("result",),
+)
+metrics.callback_counter(
+    "query_embedding_requests_total",
+    "Upstream embedding requests made for chat queries.",
+    lambda: {(): query_embedder.requests},
+)
 
 DEFAULT_QUESTION_GEN_TMPL = """\
 Here is the context:
@@ -61,108 +126,344 @@ verify that the following invoice complies with \
 standard accounting practices and regulatory requirements, \
 noting any missing mandatory information or formatting issues.
 """
+# Extractor and embedding outputs are cached on disk (outside storage/, so a
+# force_reindex keeps them) keyed by node content and transformation identity
+TRANSFORM_CACHE_PATH = os.getenv('TRANSFORM_CACHE_PATH', 'cache/transformations.db')
+TRANSFORM_CACHE_MAX_ENTRIES = int(os.getenv('TRANSFORM_CACHE_MAX_ENTRIES', '100000'))
+transform_cache = TransformationCache(TRANSFORM_CACHE_PATH, max_entries=TRANSFORM_CACHE_MAX_ENTRIES)
+metrics.callback_counter(
+    "transform_cache_nodes_total",
+    "Nodes looked up in the transformation cache by result.",
+    lambda: {("hit",): transform_cache.hits, ("miss",): transform_cache.misses},
+    labels=("result",),
+)
+
+# 'fused' produces title, questions and compliance issues in one call per pack of
+# nodes; 'separate' runs the original three extractors
+ENRICHMENT_MODE = os.getenv('ENRICHMENT_MODE', 'fused')
+ENRICHMENT_EXTRAS = [name for name in os.getenv('ENRICHMENT_EXTRAS', '').split(',') if name]
+ENRICHMENT_NODES_PER_CALL = int(os.getenv('ENRICHMENT_NODES_PER_CALL', '4'))
+
+if ENRICHMENT_MODE == 'separate':
+    # Question Answering Extractor is using the DEFAULT_QUESTION_GEN_TMPL
+    enrichment_transformations = [
+        CachedTransformation(TitleExtractor(), transform_cache),
+        CachedTransformation(QuestionsAnsweredExtractor(questions=5), transform_cache),
+        CachedTransformation(
+            ComplianceChecker(issues=5, prompt_template=COMPLIANCE_CHECKER_TMPL), transform_cache
+        ),
+    ]
+else:
+    enrichment_transformations = [
+        CachedTransformation(
+            InvoiceEnrichmentExtractor(
+                questions=5,
+                issues=5,
+                enrichments=ENRICHMENT_EXTRAS,
+                nodes_per_call=ENRICHMENT_NODES_PER_CALL,
+            ),
+            transform_cache,
+        ),
+    ]
+
 # Create an ingestion pipeline with transformations
-# Question Answering Extractor is using the DEFAULT_QUESTION_GEN_TMPL
 pipeline = IngestionPipeline(
     transformations=[
         SentenceSplitter(chunk_size=512, chunk_overlap=128),
-        TitleExtractor(),
-        QuestionsAnsweredExtractor(questions=5),
-        ComplianceChecker(issues=5, prompt_template=COMPLIANCE_CHECKER_TMPL),
-        Settings.embed_model,
-    ]
+        *enrichment_transformations,
+        CachedTransformation(Settings.embed_model, transform_cache),
+    ],
+    disable_cache=True,
 )
+# Runs the pipeline with a process pool for parsing and bounded async fan-out for enrichment
+ingestion_engine = IngestionEngine(pipeline)
 
 
-# Global variable for the index
-index = None
+def build_retriever(index, filters: Optional[MetadataFilters] = None):
+    """
+    The retriever chat queries use, narrowed to `filters` when given.
 
-async def get_ai_response(user_message: str):
-    logging.info(f"Processing message: {user_message}")
-
-    index = await update_or_create_index()
-    
-    synth = get_response_synthesizer(streaming=True)
-    
-    retriever = index.as_retriever(similarity_top_k=10)
-    logging.debug(f"Retriever created with similarity_top_k=10")
+    Resolving filters reads SQLite and may build the vector store's id map,
+    so async callers should run this in a thread.
+    """
+    # Filters narrow the candidates through the metadata index before anything is scored.
+    # index.as_retriever() would pass every node id and bypass the IVF lists, so the
+    # vector retriever is built directly and only receives ids for filtered queries.
+    node_ids = index.docstore.metadata_index.resolve(filters) if filters else None
+    if node_ids is not None:
+        logging.debug(f"Metadata filters matched {len(node_ids)} nodes")
+        index.vector_store.build_lookup()
     
-    query_engine = RetrieverQueryEngine(retriever=retriever, response_synthesizer=synth)
-    
-    streaming_response = query_engine.query(user_message)
-    
-    buffer = ""
-    for text in streaming_response.response_gen:
-        buffer += text
-        lines = buffer.split('\n')
-        # Process complete lines
-        while len(lines) > 1:
-            line = lines.pop(0)
-            if line:
-                data = {
-                    "type": "content",
-                    "text": line + '\n'  # Add newline back to preserve formatting
-                }
-                json_data = json.dumps(data)
-                yield f"data: {json_data}\n\n"
-        
-        buffer = lines[0] if lines else ""
+    if RETRIEVAL_MODE == 'hybrid':
+        retriever = HybridRetriever(
+            VectorIndexRetriever(index, similarity_top_k=RETRIEVAL_CANDIDATES, node_ids=node_ids),
+            index.docstore,
+            similarity_top_k=RETRIEVAL_TOP_K,
+            lexical_top_k=RETRIEVAL_CANDIDATES,
+            node_ids=node_ids,
+        )
+    else:
+        retriever = VectorIndexRetriever(index, similarity_top_k=RETRIEVAL_TOP_K, node_ids=node_ids)
+    logging.debug(f"{RETRIEVAL_MODE} retriever created with similarity_top_k={RETRIEVAL_TOP_K}")
+    return retriever
+
+async def _generate_answer(index, query_bundle: QueryBundle, filters: Optional[MetadataFilters] = None):
+    synth = get_response_synthesizer(streaming=True, use_async=True)
+    # Filters are resolved under the docstore's connection lock, never on the event loop
+    retriever = await asyncio.to_thread(build_retriever, index, filters) if filters else build_retriever(index)
     
-    # Yield any remaining content in the buffer
-    if buffer:
-        data = {
-            "type": "content",
-            "text": buffer
-        }
-        json_data = json.dumps(data)
-        yield f"data: {json_data}\n\n"
+    query_engine = RetrieverQueryEngine(
+        retriever=retriever, response_synthesizer=synth, node_postprocessors=[context_packer]
+    )
     
-    end_data = {
-        "type": "end"
-    }
-    end_json = json.dumps(end_data)
-    yield f"data: {end_json}\n\n"
+    # Retrieval and synthesis both run on the async path so a slow stream
+    # never holds up other connections on this worker
+    with CHAT_STAGE_SECONDS.time(stage="retrieval"):
+        if query_bundle.embedding is None:
+            # Set here, the retriever uses it rather than calling the embedding model itself
+            query_bundle.embedding = await query_embedder.embed(query_bundle.query_str)
+        nodes = await query_engine.aretrieve(query_bundle)
+    started = time.perf_counter()
+    streaming_response = await query_engine.asynthesize(query_bundle, nodes)
+    first_token_at = None
+    parts = []
+    async for text in streaming_response.async_response_gen():
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            CHAT_STAGE_SECONDS.observe(first_token_at - started, stage="synthesis_first_token")
+        parts.append(text)
+        yield text
+    finished = time.perf_counter()
+    CHAT_STAGE_SECONDS.observe(finished - started, stage="synthesis")
+    # Counted once the answer is complete; deltas are not reliably one token each
+    tokens = len(Settings.tokenizer("".join(parts)))
+    if first_token_at is not None and tokens > 1 and finished > first_token_at:
+        CHAT_TOKENS_PER_SECOND.observe((tokens - 1) / (finished - first_token_at))
+
+async def _replay(answer: str):
+    yield answer
+
+async def _collect(tokens, parts):
+    async for text in tokens:
+        parts.append(text)
+        yield text
+
+async def get_ai_response(
+    user_message: str,
+    filters: Optional[MetadataFilters] = None,
+    on_complete: Optional[Callable[[str], None]] = None,
+    memory: Optional[ConversationMemory] = None,
+):
+    logging.info(f"Processing message: {user_message}")
+    started = time.perf_counter()
+
+    # Follow-ups become standalone questions, which also makes them cacheable
+    question = user_message
+    if memory is not None:
+        with CHAT_STAGE_SECONDS.time(stage="condense"):
+            question = await memory.condense(user_message)
+    if question != user_message:
+        logging.debug(f"Condensed follow-up to: {question}")
+
+    with CHAT_STAGE_SECONDS.time(stage="index"):
+        index = index_holder.get()
+        version = index_holder.version
+    logging.debug(f"Serving from index version {version}")
+
+    query_bundle = QueryBundle(question)
+    scope = filters.model_dump_json() if filters else ""
+    with CHAT_STAGE_SECONDS.time(stage="cache_lookup"):
+        if answer_cache.similarity_threshold is not None:
+            # Computed once: used for the semantic lookup and reused by the retriever
+            query_bundle.embedding = await query_embedder.embed(question)
+        cached_answer = answer_cache.get(question, version, query_bundle.embedding, scope=scope)
+    if cached_answer is not None:
+        logging.info("Answer cache hit")
+        tokens = _replay(cached_answer)
+    else:
+        tokens = answer_cache.stream(
+            question,
+            version,
+            lambda: _generate_answer(index, query_bundle, filters),
+            embedding=query_bundle.embedding,
+            scope=scope,
+        )
+
+    parts = []
+    first_event = True
+    encoder = SSEEncoder(SSE_FLUSH_POLICY, max_bytes=SSE_COALESCE_BYTES, max_delay=SSE_COALESCE_MS / 1000)
+    async for event in encoder.stream(_collect(tokens, parts)):
+        if first_event:
+            first_event = False
+            CHAT_TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+        yield event
+    # Only reached once the whole answer has been sent
+    CHAT_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
+    answer = "".join(parts)
+    if memory is not None:
+        memory.add_turn(user_message, answer)
+    if on_complete is not None:
+        on_complete(answer)
+
+# Where the index comes from: 'local' builds and persists storage/ in this process, which
+# suits a single worker; 'snapshots' only reads the snapshots that `python ingest.py`
+# publishes to SNAPSHOT_DIR, so any number of workers share one copy of the index
+INDEX_SOURCE = os.getenv('INDEX_SOURCE', 'local')
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '3'))
+snapshot_store = SnapshotStore(SNAPSHOT_DIR, keep=SNAPSHOT_KEEP)
+
+async def load_snapshot(documents_dir=None):
+    return await asyncio.to_thread(_load_snapshot)
+
+def _load_snapshot():
+    name = snapshot_store.current_name()
+    if name is None:
+        raise FileNotFoundError(f"No index snapshot has been published to {SNAPSHOT_DIR} yet")
+    path = snapshot_store.path(name)
+    # Read-only: vectors are memory-mapped and SQLite opens the file as immutable, so
+    # every worker shares the page cache rather than holding its own copy
+    index = load_index(path, NumpyVectorStore.from_persist_dir(path, **VECTOR_STORE_KWARGS), read_only=True)
+    logging.info(f"Loaded index snapshot {name}")
+    return index
+
+def publish_snapshot(documents_dir="documents", force_reindex=False) -> Optional[str]:
+    """
+    Build the next snapshot from the current one plus document changes, and publish it.
+
+    Only the ingestion process calls this, holding `snapshot_store.writer_lock()`.
+    Returns the new snapshot's name, or None if the documents have not changed.
+    """
+    current = snapshot_store.current()
+    if current is not None and not force_reindex:
+        manifest = DocumentManifest.load(current)
+        if manifest is not None and storage_exists(current) and not manifest.diff(documents_dir).has_changes:
+            logging.info("No document changes found. Snapshot is up to date.")
+            return None
+
+    # A failed build keeps its staging directory; the next call resumes from its last batch
+    staging = snapshot_store.stage(fresh=force_reindex)
+    index = _update_or_create_index(documents_dir, force_reindex, persist_dir=staging)
+    index.storage_context.docstore.close()
+    return snapshot_store.publish(staging)
 
 async def update_or_create_index(documents_dir="documents", force_reindex=False):
-    global index
+    # Ingestion and persistence are blocking; keep them off the event loop
+    return await asyncio.to_thread(_update_or_create_index, documents_dir, force_reindex)
+
+def _update_or_create_index(documents_dir="documents", force_reindex=False, persist_dir="storage"):
     logging.info(f"Updating or creating index. force_reindex: {force_reindex}")
     
-    if force_reindex or not os.path.exists("storage"):
-        if os.path.exists("storage"):
+    manifest = None if force_reindex else DocumentManifest.load(persist_dir)
+    if manifest is not None and not storage_exists(persist_dir):
+        manifest = None
+    if manifest is None and os.path.exists(persist_dir) and not force_reindex:
+        logging.info("Storage is from an older format. Rebuilding index...")
+
+    if manifest is None:
+        if os.path.exists(persist_dir):
             import shutil
-            shutil.rmtree("storage")
+            shutil.rmtree(persist_dir)
             logging.debug("Existing storage directory removed")
         logging.info("Creating new index...")
-        all_documents = SimpleDirectoryReader(documents_dir).load_data()
-        logging.debug(f"Loaded {len(all_documents)} documents from {documents_dir}")
-        nodes = pipeline.run(documents=all_documents)
-        logging.debug(f"Created {len(nodes)} nodes from documents")
-        index = VectorStoreIndex(nodes)
-        index.storage_context.persist()  # Add this line
-        logging.info(f"Created new index with {len(nodes)} nodes and persisted to storage")
+        manifest = DocumentManifest()
+        storage_context = open_storage_context(persist_dir, NumpyVectorStore(**VECTOR_STORE_KWARGS))
+        index = VectorStoreIndex([], storage_context=storage_context)
+        # Persisted empty first, so a build that is interrupted resumes from its last batch
+        index.storage_context.persist(persist_dir)
+        manifest.persist(persist_dir)
     else:
         logging.info("Loading existing index...")
-        storage_context = StorageContext.from_defaults(persist_dir="storage")
-        index = load_index_from_storage(storage_context)
+        # Vectors are memory-mapped and nodes stay in SQLite, so loading is near-constant time
+        index = load_index(persist_dir, NumpyVectorStore.from_persist_dir(persist_dir, **VECTOR_STORE_KWARGS))
         logging.debug("Existing index loaded from storage")
-        
-        # Check for new documents and update
-        existing_docs = set(doc.get_content() for doc in index.docstore.docs.values())
-        logging.debug(f"Found {len(existing_docs)} existing documents in the index")
-        
-        new_documents = [
-            doc for doc in SimpleDirectoryReader(documents_dir).load_data() 
-            if doc.get_content() not in existing_docs
-        ]
-        
-        if new_documents:
-            logging.info(f"Found {len(new_documents)} new documents. Updating index...")
-            new_nodes = pipeline.run(documents=new_documents)
-            logging.debug(f"Created {len(new_nodes)} new nodes from new documents")
+
+    # Only files whose size/mtime moved are read, and only changed content is parsed
+    diff = manifest.diff(documents_dir)
+    if not diff.has_changes and not diff.touched:
+        logging.info("No document changes found. Index is up to date.")
+        return index
+
+    changed = len(diff.added) + len(diff.modified)
+    if changed:
+        logging.info(f"Found {changed} new or modified files. Updating index in batches of {INGEST_BATCH_FILES}...")
+    # One batch of documents and nodes in memory at a time; each is committed with its
+    # manifest entries, which is the checkpoint the next run's diff starts from
+    try:
+        for batch in diff.batches(INGEST_BATCH_FILES):
+            _apply_batch(index, manifest, batch, persist_dir)
+    except Exception:
+        # Let go of the database now rather than whenever this index is collected
+        index.storage_context.docstore.abort()
+        raise
+
+    logging.debug(f"Transformation cache: {transform_cache.stats()}")
+    logging.info(f"Index and document manifest persisted to {persist_dir}")
+
+    return index
+
+def _apply_batch(index, manifest, batch, persist_dir):
+    try:
+        stale_doc_ids = manifest.stale_doc_ids(batch)
+        for doc_id in stale_doc_ids:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        if stale_doc_ids:
+            logging.info(f"Purged {len(stale_doc_ids)} modified or removed documents from the index")
+
+        changed_files = batch.added + batch.modified
+        doc_ids, new_nodes = ingestion_engine.run(changed_files)
+        # An interrupted run may have committed these documents without their manifest entries
+        leftover = [doc_id for doc_id in set(doc_ids) - set(stale_doc_ids) if index.docstore.get_ref_doc_info(doc_id)]
+        for doc_id in leftover:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        if new_nodes:
+            logging.debug(f"Created {len(new_nodes)} new nodes from {len(doc_ids)} changed documents")
             index.insert_nodes(new_nodes)
-            index.storage_context.persist()  # Add this line
-            logging.info(f"Added {len(new_nodes)} new nodes to existing index and persisted to storage")
-        else:
-            logging.info("No new documents found. Index is up to date.")
+            logging.info(f"Added {len(new_nodes)} new nodes from {len(changed_files)} files to the index")
+    except Exception:
+        # Node writes are only committed on persist; drop them so storage stays consistent
+        index.storage_context.docstore.rollback()
+        raise
 
-    return index
\ No newline at end of file
+    manifest.apply(batch, doc_ids_by_file(doc_ids, changed_files))
+    index.storage_context.persist(persist_dir)
+    manifest.persist(persist_dir)
+
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+)
+metrics.callback_counter(
+    "answer_cache_lookups_total",
+    "Answer cache lookups by result; 'coalesced' misses joined an answer already being generated.",
+    lambda: {
+        ("hit",): answer_cache.hits,
+        ("miss",): answer_cache.misses,
+        ("coalesced",): answer_cache.coalesced,
+    },
+    labels=("result",),
+)
+
+# Process-wide index, loaded once in the app lifespan and refreshed in the background
+INDEX_REFRESH_INTERVAL = float(os.getenv('INDEX_REFRESH_INTERVAL', '30'))
+if INDEX_SOURCE == 'snapshots':
+    # Follow the snapshot pointer; polling it is a single small file read
+    index_holder = IndexHolder(
+        load_snapshot,
+        documents_dir="documents",
+        refresh_interval=INDEX_REFRESH_INTERVAL,
+        fingerprint=snapshot_store.current_name,
+    )
+else:
+    index_holder = IndexHolder(
+        update_or_create_index,
+        documents_dir="documents",
+        refresh_interval=INDEX_REFRESH_INTERVAL,
+    )
+metrics.gauge(
+    "index_version",
+    "Version of the index currently being served.",
+    lambda: {(): index_holder.version},
+)
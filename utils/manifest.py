@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+MANIFEST_FNAME = "manifest.json"
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_document_files(documents_dir: str) -> List[str]:
+    """Visible top-level files, matching what `SimpleDirectoryReader(documents_dir)` loads."""
+    if not os.path.isdir(documents_dir):
+        return []
+    return sorted(
+        os.path.join(documents_dir, entry.name)
+        for entry in os.scandir(documents_dir)
+        if not entry.name.startswith(".") and entry.is_file()
+    )
+
+
+@dataclass
+class FileEntry:
+    size: int
+    mtime_ns: int
+    sha256: str
+    doc_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ManifestDiff:
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # path -> (size, mtime_ns, sha256) for every added or modified file
+    pending: Dict[str, tuple] = field(default_factory=dict)
+    # stat changed but content did not; only the stat needs refreshing
+    touched: Dict[str, tuple] = field(default_factory=dict)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+    def batches(self, batch_size: int) -> Iterator["ManifestDiff"]:
+        """
+        Split into diffs of at most `batch_size` added or modified files each, in order,
+        followed by one holding the removed and touched files. Each can be applied and
+        persisted on its own, so a build that stops part way only redoes its last batch.
+        """
+        added = set(self.added)
+        changed = self.added + self.modified
+        for start in range(0, len(changed), max(batch_size, 1)):
+            paths = changed[start : start + batch_size]
+            yield ManifestDiff(
+                added=[path for path in paths if path in added],
+                modified=[path for path in paths if path not in added],
+                pending={path: self.pending[path] for path in paths},
+            )
+        if self.removed or self.touched:
+            yield ManifestDiff(removed=list(self.removed), touched=dict(self.touched))
+
+
+class DocumentManifest:
+    """
+    Persisted record of every ingested file: path -> size, mtime, content hash and
+    the ids of the documents it produced.
+
+    Diffing costs one `stat` per file; a file is only read (to hash it) when its
+    size or mtime moved, and only parsed when its hash actually changed.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, FileEntry]] = None) -> None:
+        self.entries: Dict[str, FileEntry] = entries or {}
+
+    @classmethod
+    def load(cls, persist_dir: str = "storage") -> Optional["DocumentManifest"]:
+        path = os.path.join(persist_dir, MANIFEST_FNAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        return cls({file: FileEntry(**entry) for file, entry in data.items()})
+
+    def persist(self, persist_dir: str = "storage") -> None:
+        os.makedirs(persist_dir, exist_ok=True)
+        path = os.path.join(persist_dir, MANIFEST_FNAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({file: asdict(entry) for file, entry in self.entries.items()}, f)
+        os.replace(tmp_path, path)
+
+    def diff(self, documents_dir: str) -> ManifestDiff:
+        diff = ManifestDiff()
+        seen = set()
+        for path in list_document_files(documents_dir):
+            seen.add(path)
+            stat = os.stat(path)
+            entry = self.entries.get(path)
+            if entry is not None and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+                continue
+            sha256 = hash_file(path)
+            if entry is None:
+                diff.added.append(path)
+                diff.pending[path] = (stat.st_size, stat.st_mtime_ns, sha256)
+            elif entry.sha256 != sha256:
+                diff.modified.append(path)
+                diff.pending[path] = (stat.st_size, stat.st_mtime_ns, sha256)
+            else:
+                diff.touched[path] = (stat.st_size, stat.st_mtime_ns, sha256)
+        diff.removed = [path for path in self.entries if path not in seen]
+        logging.debug(
+            f"Manifest diff: {len(diff.added)} added, {len(diff.modified)} modified, "
+            f"{len(diff.removed)} removed, {len(diff.touched)} touched"
+        )
+        return diff
+
+    def stale_doc_ids(self, diff: ManifestDiff) -> List[str]:
+        """Document ids whose nodes must be purged before re-ingesting `diff`."""
+        doc_ids = []
+        for path in diff.modified + diff.removed:
+            doc_ids.extend(self.entries[path].doc_ids)
+        return doc_ids
+
+    def apply(self, diff: ManifestDiff, doc_ids_by_file: Dict[str, List[str]]) -> None:
+        for path in diff.removed:
+            self.entries.pop(path, None)
+        for path, (size, mtime_ns, sha256) in diff.touched.items():
+            self.entries[path] = FileEntry(size, mtime_ns, sha256, self.entries[path].doc_ids)
+        for path, (size, mtime_ns, sha256) in diff.pending.items():
+            self.entries[path] = FileEntry(size, mtime_ns, sha256, doc_ids_by_file.get(path, []))
+
+
+def doc_ids_by_file(doc_ids: List[str], input_files: List[str]) -> Dict[str, List[str]]:
+    """Group ids of documents loaded with `filename_as_id=True` back under their source file."""
+    files = set(input_files)
+    grouped: Dict[str, List[str]] = {}
+    for doc_id in doc_ids:
+        path = doc_id if doc_id in files else doc_id.rsplit("_part_", 1)[0]
+        grouped.setdefault(path, []).append(doc_id)
+    return grouped
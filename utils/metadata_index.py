@@ -0,0 +1,140 @@
+import re
+import sqlite3
+from typing import Any, Callable, ContextManager, Dict, List, Sequence, Tuple
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+# Reader metadata plus extractor output; long free-text fields are not indexed
+INDEXED_METADATA_KEYS = (
+    "file_name",
+    "file_path",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "document_title",
+    "has_compliance_issues",
+)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS metadata_index ("
+    "node_id TEXT NOT NULL, key TEXT NOT NULL, text_value TEXT, num_value REAL)",
+    "CREATE INDEX IF NOT EXISTS metadata_index_text ON metadata_index (key, text_value)",
+    "CREATE INDEX IF NOT EXISTS metadata_index_num ON metadata_index (key, num_value)",
+    "CREATE INDEX IF NOT EXISTS metadata_index_node ON metadata_index (node_id)",
+)
+
+_OPERATORS = {
+    FilterOperator.EQ: "=",
+    FilterOperator.NE: "!=",
+    FilterOperator.GT: ">",
+    FilterOperator.GTE: ">=",
+    FilterOperator.LT: "<",
+    FilterOperator.LTE: "<=",
+    FilterOperator.IN: "IN",
+    FilterOperator.NIN: "NOT IN",
+    FilterOperator.TEXT_MATCH: "LIKE",
+}
+_NO_ISSUES_RE = re.compile(r"^\W*(none|no (compliance )?issues|n/?a)\b", re.IGNORECASE)
+
+
+def _derived_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    issues = metadata.get("compliance_issues")
+    if issues is None:
+        return {}
+    return {"has_compliance_issues": int(bool(issues.strip()) and not _NO_ISSUES_RE.match(issues))}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class MetadataIndex:
+    """
+    Typed secondary indexes over node metadata, stored in the docstore's SQLite file.
+
+    Strings (including ISO dates, which compare correctly as text) and numbers
+    are indexed in separate columns, so equality, range and set filters are
+    index lookups. `resolve` turns `MetadataFilters` into the matching node ids
+    before any similarity scoring runs.
+    """
+
+    def __init__(
+        self,
+        connection: Callable[[], ContextManager[sqlite3.Connection]],
+        keys: Sequence[str] = INDEXED_METADATA_KEYS,
+    ) -> None:
+        self._connection = connection
+        self.keys = tuple(keys)
+
+    def add(self, nodes: Sequence[BaseNode]) -> None:
+        if not nodes:
+            return
+        self.remove([node.node_id for node in nodes])
+        rows = []
+        for node in nodes:
+            metadata = {**node.metadata, **_derived_metadata(node.metadata)}
+            for key in self.keys:
+                value = metadata.get(key)
+                if _is_number(value):
+                    rows.append((node.node_id, key, None, float(value)))
+                elif isinstance(value, str):
+                    rows.append((node.node_id, key, value, None))
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO metadata_index (node_id, key, text_value, num_value) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def remove(self, node_ids: Sequence[str]) -> None:
+        if not node_ids:
+            return
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM metadata_index WHERE node_id = ?", [(node_id,) for node_id in node_ids])
+
+    def _clause(self, metadata_filter: MetadataFilter) -> Tuple[str, List[Any]]:
+        if metadata_filter.key not in self.keys:
+            raise ValueError(f"Metadata key '{metadata_filter.key}' is not indexed")
+        operator = _OPERATORS.get(metadata_filter.operator)
+        if operator is None:
+            raise ValueError(f"Unsupported filter operator '{metadata_filter.operator.value}'")
+        value = metadata_filter.value
+        values = value if isinstance(value, list) else [value]
+        if not values:
+            raise ValueError(f"Filter on '{metadata_filter.key}' has no values")
+        if isinstance(value, list) and operator not in ("IN", "NOT IN"):
+            raise ValueError(f"Filter '{metadata_filter.operator.value}' on '{metadata_filter.key}' takes a single value")
+        column = "num_value" if all(_is_number(v) for v in values) else "text_value"
+        if column == "text_value":
+            values = [str(v) for v in values]
+        if operator in ("IN", "NOT IN"):
+            placeholders = ",".join("?" * len(values))
+            condition = f"{column} {operator} ({placeholders})"
+        elif operator == "LIKE":
+            condition, values = f"{column} LIKE ?", [f"%{values[0]}%"]
+        else:
+            condition = f"{column} {operator} ?"
+        return f"SELECT node_id FROM metadata_index WHERE key = ? AND {condition}", [metadata_filter.key, *values]
+
+    def _query(self, filters: MetadataFilters) -> Tuple[str, List[Any]]:
+        parts: List[str] = []
+        params: List[Any] = []
+        for item in filters.filters:
+            sql, item_params = self._query(item) if isinstance(item, MetadataFilters) else self._clause(item)
+            parts.append(f"SELECT node_id FROM ({sql})")
+            params.extend(item_params)
+        compound = " UNION " if filters.condition == FilterCondition.OR else " INTERSECT "
+        return compound.join(parts), params
+
+    def resolve(self, filters: MetadataFilters) -> List[str]:
+        """Node ids matching `filters`."""
+        if not filters.filters:
+            raise ValueError("No filters to resolve")
+        sql, params = self._query(filters)
+        with self._connection() as conn:
+            return [node_id for (node_id,) in conn.execute(sql, params)]
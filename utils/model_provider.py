@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+import typing
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.bridge.pydantic import BaseModel, Field
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.llms.llm import LLM
+from llama_index.core.prompts import BasePromptTemplate
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+class FakeLLM(CustomLLM):
+    """
+    Deterministic local stand-in for the chat LLM.
+
+    The same prompt always gives the same answer: `output_tokens` words drawn
+    from the prompt itself. Timing mimics a hosted model, with the first token
+    after `first_token_latency` seconds and the rest at `tokens_per_second`.
+    Structured output is filled in from the output class's fields, with a
+    `num_<field>` prompt argument setting how many items a list field gets.
+    """
+
+    output_tokens: int = Field(default=64, description="Words per completion.", gt=0)
+    first_token_latency: float = Field(default=0.3, description="Seconds before the first token.", ge=0)
+    tokens_per_second: float = Field(default=80.0, description="Generation speed after the first token.", gt=0)
+    words_per_line: int = Field(default=16, description="Words per line of output.", gt=0)
+    context_window: int = Field(default=128000, description="Advertised context window.", gt=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.output_tokens,
+            model_name="fake",
+            is_chat_model=False,
+        )
+
+    def _tokens(self, prompt: str, count: Optional[int] = None) -> List[str]:
+        words = _WORD_RE.findall(prompt) or ["ok"]
+        rng = np.random.default_rng(_seed(prompt))
+        picks = rng.integers(0, len(words), size=count or self.output_tokens)
+        # Line breaks every `words_per_line` words, so line-based SSE flushing behaves as with a real answer
+        return [
+            words[i] + ("\n" if n % self.words_per_line == self.words_per_line - 1 else " ")
+            for n, i in enumerate(picks)
+        ]
+
+    def _delays(self, count: int) -> List[float]:
+        return [self.first_token_latency] + [1.0 / self.tokens_per_second] * (count - 1)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        tokens = self._tokens(prompt)
+        time.sleep(sum(self._delays(len(tokens))))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for token, delay in zip(self._tokens(prompt), self._delays(self.output_tokens)):
+                time.sleep(delay)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(sum(self._delays(len(tokens))))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        async def gen():
+            text = ""
+            for token, delay in zip(self._tokens(prompt), self._delays(self.output_tokens)):
+                await asyncio.sleep(delay)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    # -- structured output ----------------------------------------------------
+
+    def _fill(self, annotation: Any, name: str, index: int, words: List[str], kwargs: Dict[str, Any]) -> Any:
+        origin = typing.get_origin(annotation)
+        if origin is typing.Union:
+            args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+            return self._fill(args[0], name, index, words, kwargs)
+        if origin in (list, List, Sequence):
+            (item,) = typing.get_args(annotation) or (str,)
+            count = int(kwargs.get(f"num_{name}", 1))
+            return [self._fill(item, name, i, words, kwargs) for i in range(count)]
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return self._instance(annotation, index, words, kwargs)
+        if annotation is int:
+            return index
+        if annotation is float:
+            return float(index)
+        if annotation is bool:
+            return False
+        return " ".join(words[(index + i) % len(words)] for i in range(8))
+
+    def _instance(self, output_cls: Type[BaseModel], index: int, words: List[str], kwargs: Dict[str, Any]) -> BaseModel:
+        return output_cls(
+            **{
+                name: self._fill(field.annotation, name, index, words, kwargs)
+                for name, field in output_cls.model_fields.items()
+            }
+        )
+
+    def _structured(self, output_cls: Type[BaseModel], prompt: BasePromptTemplate, kwargs: Dict[str, Any]) -> Tuple[BaseModel, float]:
+        text = prompt.format(**kwargs)
+        words = [token.strip() for token in self._tokens(text, 64)]
+        result = self._instance(output_cls, 0, words, kwargs)
+        output_tokens = len(json.dumps(result.model_dump()).split())
+        return result, sum(self._delays(max(output_tokens, 1)))
+
+    def structured_predict(self, output_cls: Type[BaseModel], prompt: BasePromptTemplate, **prompt_args: Any) -> BaseModel:
+        result, delay = self._structured(output_cls, prompt, prompt_args)
+        time.sleep(delay)
+        return result
+
+    async def astructured_predict(
+        self, output_cls: Type[BaseModel], prompt: BasePromptTemplate, **prompt_args: Any
+    ) -> BaseModel:
+        result, delay = self._structured(output_cls, prompt, prompt_args)
+        await asyncio.sleep(delay)
+        return result
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Deterministic local stand-in for the embedding model.
+
+    Words and word pairs are hashed into `embed_dim` signed buckets, so texts
+    that share terms land close together. Every call waits `latency` seconds,
+    whatever the batch size, like one request to a hosted API.
+    """
+
+    embed_dim: int = Field(default=256, description="Embedding size.", gt=0)
+    latency: float = Field(default=0.05, description="Seconds per embedding request.", ge=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        words = _WORD_RE.findall(text.lower())
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            seed = _seed(feature)
+            vector[seed % self.embed_dim] += 1.0 if (seed >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+def create_models(provider: str, **options: Any) -> Tuple[LLM, BaseEmbedding]:
+    """
+    The LLM and embedding model for `provider`.
+
+    'openai' is the hosted gpt-4o-mini and text-embedding-3-small pair; 'fake'
+    is the deterministic local pair for benchmarks and offline runs. `options`
+    are the fake models' timing settings.
+    """
+    if provider == "openai":
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        from llama_index.llms.openai import OpenAI
+
+        api_key = options.get("api_key")
+        return (
+            OpenAI(model="gpt-4o-mini", api_key=api_key),
+            OpenAIEmbedding(model="text-embedding-3-small", api_key=api_key),
+        )
+    if provider == "fake":
+        llm = FakeLLM(
+            output_tokens=options.get("output_tokens", 64),
+            first_token_latency=options.get("first_token_latency", 0.3),
+            tokens_per_second=options.get("tokens_per_second", 80.0),
+        )
+        embed_model = FakeEmbedding(
+            embed_dim=options.get("embed_dim", 256),
+            latency=options.get("embed_latency", 0.05),
+            embed_batch_size=100,
+        )
+        return llm, embed_model
+    raise ValueError(f"Unknown model provider '{provider}'")
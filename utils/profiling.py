@@ -0,0 +1,156 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from typing import Optional, Sequence
+
+# Opt-in profiling: PROFILE_MODE ('cpu' or 'memory') profiles the whole process,
+# PROFILE_REQUESTS=true profiles single requests sent with an X-Profile header
+PROFILE_MODE = os.getenv('PROFILE_MODE', '')
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', 'false').lower() == 'true'
+PROFILE_OUTPUT_DIR = os.getenv('PROFILE_OUTPUT_DIR', 'profiles')
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', '40'))
+
+PROFILE_MODES = ("cpu", "memory")
+_PROFILE_HEADER = b"x-profile"
+
+
+def _write_report(output_dir: str, name: str, text: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def _report_name(label: str, mode: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_") or "process"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{time.monotonic_ns() % 1_000_000:06d}-{slug}-{mode}.txt"
+
+
+def _cpu_report(profile: cProfile.Profile, top: int) -> str:
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    return out.getvalue()
+
+
+def _memory_report(before: Optional[tracemalloc.Snapshot], after: tracemalloc.Snapshot, top: int) -> str:
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", ""]
+    if before is None:
+        lines += [str(stat) for stat in after.statistics("lineno")[:top]]
+    else:
+        lines += [str(stat) for stat in after.compare_to(before, "lineno")[:top]]
+    return "\n".join(lines) + "\n"
+
+
+class ProcessProfiler:
+    """
+    Whole-process profiling, selected with PROFILE_MODE and reported on shutdown.
+
+    'memory' traces allocations with tracemalloc from startup; 'cpu' runs
+    cProfile on the event loop thread. Both slow the server down noticeably,
+    so neither is on by default.
+    """
+
+    def __init__(self, mode: str, output_dir: str, top: int = 40) -> None:
+        if mode and mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'; expected one of {', '.join(PROFILE_MODES)}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.top = top
+        self._profile: Optional[cProfile.Profile] = None
+
+    def start(self) -> None:
+        if self.mode == "memory":
+            tracemalloc.start()
+        elif self.mode == "cpu":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.mode:
+            logging.info(f"Process {self.mode} profiling enabled")
+
+    def stop(self) -> None:
+        if self.mode == "memory" and tracemalloc.is_tracing():
+            report = _memory_report(None, tracemalloc.take_snapshot(), self.top)
+            tracemalloc.stop()
+        elif self.mode == "cpu" and self._profile is not None:
+            self._profile.disable()
+            report = _cpu_report(self._profile, self.top)
+            self._profile = None
+        else:
+            return
+        path = _write_report(self.output_dir, _report_name("process", self.mode), report)
+        logging.info(f"Wrote {self.mode} profile to {path}")
+
+
+class ProfilingMiddleware:
+    """
+    Per-request profiling for requests sent with an `X-Profile: cpu|memory` header.
+
+    The profile covers the whole response, streamed bodies included, and is
+    written to `output_dir` when it finishes. One request is profiled at a time
+    (others are served normally), and since everything on a worker shares the
+    event loop, concurrent requests show up in the profile too; profile on an
+    otherwise idle worker for clean numbers.
+    """
+
+    def __init__(self, app, output_dir: str, top: int = 40, modes: Sequence[str] = PROFILE_MODES) -> None:
+        self.app = app
+        self.output_dir = output_dir
+        self.top = top
+        self.modes = tuple(modes)
+        self._busy = False
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = dict(scope["headers"]).get(_PROFILE_HEADER, b"").decode().strip().lower()
+        if not mode:
+            await self.app(scope, receive, send)
+            return
+        if mode not in self.modes or self._busy:
+            reason = "another request is being profiled" if self._busy else f"mode '{mode}' is not available"
+            logging.warning(f"Not profiling {scope['path']}: {reason}")
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        try:
+            if mode == "cpu":
+                report = await self._profile_cpu(scope, receive, send)
+            else:
+                report = await self._profile_memory(scope, receive, send)
+            label = f"{scope['method']} {scope['path']}"
+            path = await asyncio.to_thread(_write_report, self.output_dir, _report_name(label, mode), report)
+            logging.info(f"Wrote {mode} profile of {label} to {path}")
+        finally:
+            self._busy = False
+
+    async def _profile_cpu(self, scope, receive, send) -> str:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.disable()
+        return _cpu_report(profile, self.top)
+
+    async def _profile_memory(self, scope, receive, send) -> str:
+        # Reuse process-wide tracing if PROFILE_MODE=memory already started it
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            await self.app(scope, receive, send)
+            return _memory_report(before, tracemalloc.take_snapshot(), self.top)
+        finally:
+            if started_here:
+                tracemalloc.stop()
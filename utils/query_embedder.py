@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace-insensitive form of a query; case is kept, since the model sees it."""
+    return " ".join(text.split())
+
+
+class QueryEmbedder:
+    """
+    Front end for query embeddings: an LRU cache plus micro-batching of cache misses.
+
+    Results are cached per (model, normalized text), and a query that is already
+    being embedded waits for that result instead of sending its own. Misses that
+    arrive within `window` seconds of each other go upstream together in one
+    batched request of up to `batch_size` texts. Batches use the model's text
+    embedding path, which is only right for symmetric models like
+    text-embedding-3-*; `batch_size=1` embeds each query on its own through the
+    query path, keeping the cache and deduplication.
+    """
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        max_entries: int = 4096,
+        batch_size: int = 32,
+        window: float = 0.005,
+    ) -> None:
+        self._embed_model = embed_model
+        self.model_name = embed_model.model_name
+        self.max_entries = max_entries
+        self.batch_size = max(batch_size, 1)
+        self.window = window
+        self._cache: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._pending: List[Tuple[str, str]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.requests = 0
+
+    async def embed(self, text: str) -> List[float]:
+        key = (self.model_name, normalize_text(text))
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return vector
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._pending.append(key)
+            if len(self._pending) >= self.batch_size or self.window <= 0:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        # Shielded: a waiter that goes away must not cancel the result for the others
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, str]]) -> None:
+        texts = [text for _, text in batch]
+        try:
+            if self.batch_size == 1:
+                self.requests += len(texts)
+                vectors = await asyncio.gather(*(self._embed_model.aget_query_embedding(text) for text in texts))
+            else:
+                self.requests += 1
+                vectors = await self._embed_model.aget_text_embedding_batch(texts)
+        except Exception as e:
+            logging.error(f"Query embedding failed for {len(texts)} queries: {str(e)}")
+            for key in batch:
+                future = self._inflight.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+                    # Marked retrieved, so a batch whose waiters all left is not reported as unhandled
+                    future.exception()
+            return
+        if len(batch) > 1:
+            logging.debug(f"Embedded {len(batch)} queries in one request")
+        for key, vector in zip(batch, vectors):
+            self._cache[key] = vector
+            future = self._inflight.pop(key)
+            if not future.done():
+                future.set_result(vector)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
@@ -1,39 +1,114 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
 from jose import JWTError, jwt
-from hashlib import sha256
 from models.user import User
+from database import AsyncSessionLocal
+from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from schemas import auth as auth_schemas
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils import metrics
+import asyncio
+import hashlib
+import hmac
+import logging
 import os
 import secrets
-import hashlib
+import time
 # Secret key and algorithm for JWT encoding/decoding
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Mock database
-fake_users_db = {
-    "johndoe": User(
-        username="johndoe",
-        full_name="John Doe",
-        email="johndoe@example.com",
-        hashed_password=sha256("secret".encode()).hexdigest(),
-        disabled=False,
-    )
-}
+# PBKDF2 cost for new hashes; stored hashes keep their own and are upgraded on login
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', '100000'))
+# Threads for hashing; hashlib releases the GIL, so this bounds CPU spent on logins
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+
+# Validated tokens are remembered this long (capped at their expiry), so a user
+# disabled in the database keeps access for at most AUTH_CACHE_TTL seconds
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000'))
+
+_HASH_SCHEME = "pbkdf2_sha256"
+
+
+class PasswordHasher:
+    """
+    Salted PBKDF2-SHA256 run on a bounded thread pool so logins never block the event loop.
+
+    Hashes are stored as `pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>`, so
+    each one verifies with the salt and cost it was created with.
+    """
+
+    def __init__(self, iterations: int, max_workers: int) -> None:
+        self.iterations = iterations
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        # Verified against when a username is unknown, so both cases take the same time
+        self._dummy_hash = f"{_HASH_SCHEME}${iterations}${'00' * 16}${'00' * 32}"
+
+    def _hash(self, password: str, iterations: int, salt: Optional[bytes] = None) -> str:
+        salt = salt or secrets.token_bytes(16)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+        return f"{_HASH_SCHEME}${iterations}${salt.hex()}${digest.hex()}"
+
+    def _verify(self, password: str, hashed_password: str) -> bool:
+        try:
+            scheme, iterations, salt, digest = hashed_password.split("$")
+            if scheme != _HASH_SCHEME:
+                return False
+            expected = bytes.fromhex(digest)
+            actual = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        try:
+            scheme, iterations, _, _ = hashed_password.split("$")
+            return scheme != _HASH_SCHEME or int(iterations) != self.iterations
+        except ValueError:
+            return True
+
+    async def hash(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._hash, password, self.iterations)
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> bool:
+        loop = asyncio.get_running_loop()
+        if hashed_password is None:
+            await loop.run_in_executor(self._executor, self._verify, password, self._dummy_hash)
+            return False
+        return await loop.run_in_executor(self._executor, self._verify, password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
 
-def hash_password(password: str) -> str:
-    salt = secrets.token_bytes(32)
-    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000).hex()
+password_hasher = PasswordHasher(PASSWORD_HASH_ITERATIONS, PASSWORD_HASH_WORKERS)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return hashed_password == hash_password(plain_password)
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def authenticate_user(username: str, password: str):
-    user = fake_users_db.get(username)
-    if not user or not verify_password(password, user.hashed_password):
+async def verify_password(plain_password: str, hashed_password: Optional[str]) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_user(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalar_one_or_none()
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user(db, username)
+    if not await verify_password(password, user.hashed_password if user else None):
         return None
+    if password_hasher.needs_rehash(user.hashed_password):
+        user.hashed_password = await hash_password(password)
+        await db.commit()
+        logging.info(f"Upgraded password hash for {username}")
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -42,18 +117,106 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+
+
+class TokenCache:
+    """
+    Bounded TTL cache from access token to the user it authenticates.
+
+    A hit skips the signature check and the user lookup. Entries expire after
+    `ttl` seconds or when the token does, whichever is first, and are evicted
+    LRU beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[auth_schemas.User, float]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[auth_schemas.User]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user: auth_schemas.User, token_expires_at: float) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        remaining = token_expires_at - time.time()
+        if remaining <= 0:
+            return
+        self._entries[token] = (user, time.monotonic() + min(self.ttl, remaining))
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
-def create_user(user: auth_schemas.UserCreate):
-    if user.username in fake_users_db:
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+token_cache = TokenCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL)
+metrics.callback_counter(
+    "auth_token_cache_lookups_total",
+    "Access token cache lookups by result.",
+    lambda: {("hit",): token_cache.hits, ("miss",): token_cache.misses},
+    labels=("result",),
+)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> auth_schemas.User:
+    user = token_cache.get(token)
+    if user is None:
+        credentials_exception = HTTPException(
+            status_code=401,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise credentials_exception
+        username = claims.get("sub")
+        if username is None or "exp" not in claims:
+            raise credentials_exception
+        # Only a cache miss touches the database
+        async with AsyncSessionLocal() as db:
+            db_user = await get_user(db, username)
+        if db_user is None:
+            raise credentials_exception
+        user = auth_schemas.User.model_validate(db_user)
+        token_cache.put(token, user, claims["exp"])
+    if user.disabled:
+        raise HTTPException(status_code=403, detail="Inactive user")
+    return user
+
+async def create_user(db: AsyncSession, user: auth_schemas.UserCreate):
+    existing = await db.execute(
+        select(User.id).where(or_(User.username == user.username, User.email == user.email))
+    )
+    if existing.first() is not None:
         return None
-    hashed_password = hash_password(user.password)
     db_user = User(
         username=user.username,
         full_name=user.full_name,
         email=user.email,
-        hashed_password=hashed_password,
+        hashed_password=await hash_password(user.password),
         disabled=False
     )
-    fake_users_db[user.username] = db_user
-    return db_user
\ No newline at end of file
+    db.add(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Another worker registered the same username or email in the meantime
+        await db.rollback()
+        return None
+    return db_user
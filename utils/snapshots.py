@@ -0,0 +1,152 @@
+import logging
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows; the server must still import this module in the default local mode
+    fcntl = None
+    import msvcrt
+
+from utils.storage import INDEX_DB_NAME, copy_database
+
+CURRENT_FNAME = "CURRENT"
+_SNAPSHOT_RE = re.compile(r"^v(\d{6,})$")
+_STAGING_PREFIX = ".staging-"
+_SEEDING_SUFFIX = ".seeding"
+# Vector data files are only ever appended to past the committed row count, so a new
+# snapshot can share them with the previous one; everything else is copied
+_SHARED_SUFFIXES = (".f32", ".labels", ".offsets")
+
+
+def _fsync_dir(path: str) -> None:
+    if os.name == "nt":
+        # Directories cannot be opened for fsync there; renames are journaled by NTFS
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SnapshotStore:
+    """
+    Immutable, versioned index snapshots under `root`, for one writer and many readers.
+
+    Each snapshot is a complete storage directory (`v000001`, `v000002`, ...).
+    `CURRENT` names the live one and is only ever replaced atomically, so a
+    reader that follows it always opens a fully written snapshot. The writer
+    builds the next version in a staging directory, seeded from the current
+    one, and publishes it with a rename plus a pointer swap. A build that
+    stops part way keeps its staging directory and picks it up again. Older snapshots
+    beyond `keep` are deleted; readers still mapping one keep their open files.
+    """
+
+    def __init__(self, root: str = "snapshots", keep: int = 3) -> None:
+        self.root = root
+        self.keep = max(keep, 1)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def current_name(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, CURRENT_FNAME)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return name or None
+
+    def current(self) -> Optional[str]:
+        """Directory of the live snapshot, or None if nothing has been published."""
+        name = self.current_name()
+        return self.path(name) if name is not None else None
+
+    def _published(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        names = [name for name in os.listdir(self.root) if _SNAPSHOT_RE.match(name)]
+        return sorted(names, key=lambda name: int(name[1:]))
+
+    @contextmanager
+    def writer_lock(self) -> Iterator[None]:
+        """Held by the ingestion process for as long as it runs; a second writer fails fast."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".writer.lock"), "w") as lock_file:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                raise RuntimeError(f"Another ingestion process is already writing to {self.root}")
+            yield
+
+    def stage(self, fresh: bool = False) -> str:
+        """
+        A staging directory for the next snapshot holding a copy of the current one (empty if `fresh`).
+
+        Unless `fresh`, the staging directory of an interrupted build of the same
+        version is returned as it was left, so the build continues from its last checkpoint.
+        """
+        published = self._published()
+        number = int(published[-1][1:]) + 1 if published else 1
+        staging = self.path(f"{_STAGING_PREFIX}v{number:06d}")
+        # Left behind by a writer that stopped while seeding, or before an earlier version
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            if name.startswith(_STAGING_PREFIX) and self.path(name) != staging:
+                shutil.rmtree(self.path(name), ignore_errors=True)
+        if os.path.isdir(staging):
+            if not fresh:
+                logging.info(f"Resuming interrupted snapshot build in {staging}")
+                return staging
+            shutil.rmtree(staging)
+
+        # Seeded under another name so a half-made copy is never mistaken for a checkpoint
+        seeding = f"{staging}{_SEEDING_SUFFIX}"
+        os.makedirs(seeding)
+        current = self.current()
+        if current is not None and not fresh:
+            for name in os.listdir(current):
+                src, dst = os.path.join(current, name), os.path.join(seeding, name)
+                if name == INDEX_DB_NAME:
+                    copy_database(current, seeding)
+                elif name.endswith(_SHARED_SUFFIXES):
+                    os.link(src, dst)
+                elif os.path.isfile(src):
+                    shutil.copy2(src, dst)
+        os.rename(seeding, staging)
+        return staging
+
+    def publish(self, staging: str) -> str:
+        """Make `staging` the live snapshot. Its storage must be closed. Returns the snapshot name."""
+        name = os.path.basename(staging)[len(_STAGING_PREFIX):]
+        for entry in os.listdir(staging):
+            if entry.endswith((".tmp", "-wal", "-shm")):
+                os.remove(os.path.join(staging, entry))
+        _fsync_dir(staging)
+        os.rename(staging, self.path(name))
+
+        pointer = os.path.join(self.root, CURRENT_FNAME)
+        with open(f"{pointer}.tmp", "w") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{pointer}.tmp", pointer)
+        _fsync_dir(self.root)
+        logging.info(f"Published index snapshot {name}")
+        self._prune()
+        return name
+
+    def _prune(self) -> None:
+        current = self.current_name()
+        for name in self._published()[: -self.keep]:
+            if name != current:
+                shutil.rmtree(self.path(name), ignore_errors=True)
+                logging.debug(f"Removed old index snapshot {name}")
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+from enum import Enum
+from typing import AsyncIterator, List, Optional
+
+
+class FlushPolicy(str, Enum):
+    TOKEN = "token"  # one event per token: lowest time-to-first-byte
+    LINE = "line"  # one event per complete line
+    COALESCE = "coalesce"  # one event per `max_bytes` or `max_delay`, whichever comes first
+
+
+def encode_event(data: dict) -> str:
+    """Frame one SSE event. Each event is serialized exactly once."""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def content_event(text: str) -> str:
+    return encode_event({"type": "content", "text": text})
+
+
+END_EVENT = encode_event({"type": "end"})
+
+
+class SSEEncoder:
+    """
+    Incremental SSE framing for a token stream.
+
+    Every character is scanned once: only the newly fed token is searched for
+    newlines, and pending text is kept as a list of parts that is joined once
+    when it is flushed.
+    """
+
+    def __init__(
+        self,
+        policy: FlushPolicy = FlushPolicy.LINE,
+        max_bytes: int = 512,
+        max_delay: float = 0.05,
+    ) -> None:
+        self.policy = FlushPolicy(policy)
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._pending_since: Optional[float] = None
+
+    def feed(self, text: str) -> List[str]:
+        """Add a token and return the events that are ready to send."""
+        if not text:
+            return []
+        if self.policy is FlushPolicy.TOKEN:
+            return [content_event(text)]
+        if self.policy is FlushPolicy.LINE:
+            return self._feed_line(text)
+        return self._feed_coalesce(text)
+
+    def _feed_line(self, text: str) -> List[str]:
+        cut = text.rfind("\n")
+        if cut < 0:
+            self._pending.append(text)
+            return []
+        self._pending.append(text[: cut + 1])
+        complete = "".join(self._pending)
+        rest = text[cut + 1 :]
+        self._pending = [rest] if rest else []
+        # Empty lines are dropped, as the original line framing did
+        return [content_event(line + "\n") for line in complete.split("\n")[:-1] if line]
+
+    def _feed_coalesce(self, text: str) -> List[str]:
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self._pending.append(text)
+        self._pending_bytes += len(text.encode())
+        if self._pending_bytes >= self.max_bytes or self._expired():
+            return self.flush()
+        return []
+
+    def _expired(self) -> bool:
+        return (
+            self._pending_since is not None
+            and time.monotonic() - self._pending_since >= self.max_delay
+        )
+
+    def _time_to_deadline(self) -> Optional[float]:
+        if self.policy is not FlushPolicy.COALESCE or self._pending_since is None:
+            return None
+        return max(0.0, self.max_delay - (time.monotonic() - self._pending_since))
+
+    def flush(self) -> List[str]:
+        """Emit whatever is pending, complete line or not."""
+        text = "".join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        self._pending_since = None
+        return [content_event(text)] if text else []
+
+    async def stream(self, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Frame `tokens` as SSE events, ending with the `end` event."""
+        if self.policy is not FlushPolicy.COALESCE:
+            async for text in tokens:
+                for event in self.feed(text):
+                    yield event
+        else:
+            # Wait for the next token only until the coalescing deadline, so a
+            # stalled upstream does not hold back text that is already buffered
+            iterator = tokens.__aiter__()
+            next_token: Optional[asyncio.Future] = None
+            try:
+                while True:
+                    if next_token is None:
+                        next_token = asyncio.ensure_future(iterator.__anext__())
+                    done, _ = await asyncio.wait({next_token}, timeout=self._time_to_deadline())
+                    if not done:
+                        for event in self.flush():
+                            yield event
+                        continue
+                    task, next_token = next_token, None
+                    try:
+                        text = task.result()
+                    except StopAsyncIteration:
+                        break
+                    for event in self.feed(text):
+                        yield event
+            finally:
+                if next_token is not None:
+                    next_token.cancel()
+        for event in self.flush():
+            yield event
+        yield END_EVENT
@@ -0,0 +1,300 @@
+import json
+import os
+import sqlite3
+import threading
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import fsspec
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.data_structs.data_structs import IndexStruct
+from llama_index.core.indices.base import BaseIndex
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.kvstore.types import DEFAULT_BATCH_SIZE, DEFAULT_COLLECTION, BaseKVStore
+
+from utils import bm25, metadata_index
+from utils.bm25 import BM25Index
+from utils.metadata_index import MetadataIndex
+from utils.vector_store import NumpyVectorStore
+
+INDEX_DB_NAME = "index.db"
+# Bumped when the tables change; storage written by another version is rebuilt
+STORAGE_VERSION = 4
+
+
+class SqliteKVStore(BaseKVStore):
+    """
+    Key-value store in a single SQLite file (WAL mode).
+
+    Writes accumulate in one transaction until `commit()`. Between writes the
+    connection holds a read transaction, so it keeps seeing the state it loaded
+    or last committed: an index that is still serving queries stays consistent
+    with its vectors while another connection updates the same file.
+    """
+
+    def __init__(self, path: str, schema: Sequence[str] = (), version: int = 0, read_only: bool = False) -> None:
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            # Published snapshots never change, so SQLite can skip locking and the WAL entirely
+            uri = f"file:{urllib.request.pathname2url(os.path.abspath(path))}?mode=ro&immutable=1"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._snapshot()
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (collection, key)) WITHOUT ROWID"
+        )
+        for statement in schema:
+            self._conn.execute(statement)
+        if version and self._conn.execute("PRAGMA user_version").fetchone()[0] != version:
+            self._conn.execute(f"PRAGMA user_version = {version}")
+        self._conn.commit()
+        self._snapshot()
+
+    def _snapshot(self) -> None:
+        self._conn.execute("BEGIN")
+        self._conn.execute("SELECT 1 FROM kv LIMIT 1").fetchall()
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection=collection)
+
+    def put_all(
+        self,
+        kv_pairs: List[Tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)",
+                [(collection, key, json.dumps(val)) for key, val in kv_pairs],
+            )
+
+    async def aput_all(
+        self,
+        kv_pairs: List[Tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        self.put_all(kv_pairs, collection=collection, batch_size=batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection=collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE collection = ?", (collection,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection=collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            )
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection=collection)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """The underlying connection, for tables kept next to the key-value data."""
+        with self._lock:
+            yield self._conn
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._snapshot()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._conn.rollback()
+            self._snapshot()
+
+    def close(self) -> None:
+        """Commit and close, leaving a single self-contained file (no -wal or -shm) behind."""
+        with self._lock:
+            self._conn.commit()
+            if not self.read_only:
+                self._conn.execute("PRAGMA journal_mode=DELETE")
+            self._conn.close()
+
+    def abort(self) -> None:
+        """Roll back and close as is; unlike `close`, works while other connections have the file open."""
+        with self._lock:
+            self._conn.rollback()
+            self._conn.close()
+
+
+class SqliteDocumentStore(KVDocumentStore):
+    """
+    Document store on a `SqliteKVStore`; `persist` commits instead of rewriting a JSON file.
+
+    Node text is also indexed in `bm25` and node metadata in `metadata_index`
+    as nodes are added and removed, in the same transaction.
+    """
+
+    def __init__(self, kvstore: SqliteKVStore, namespace: Optional[str] = None) -> None:
+        super().__init__(kvstore, namespace=namespace)
+        self.bm25 = BM25Index(kvstore.connection)
+        self.metadata_index = MetadataIndex(kvstore.connection)
+        self._secondary_indexes = (self.bm25, self.metadata_index)
+
+    def _index_nodes(self, docs: Sequence[BaseNode]) -> None:
+        for secondary_index in self._secondary_indexes:
+            secondary_index.add(docs)
+
+    def _unindex_nodes(self, node_ids: Sequence[str]) -> None:
+        for secondary_index in self._secondary_indexes:
+            secondary_index.remove(node_ids)
+
+    def add_documents(
+        self,
+        docs: Sequence[BaseNode],
+        allow_update: bool = True,
+        batch_size: Optional[int] = None,
+        store_text: bool = True,
+    ) -> None:
+        super().add_documents(docs, allow_update=allow_update, batch_size=batch_size, store_text=store_text)
+        self._index_nodes(docs)
+
+    async def async_add_documents(
+        self,
+        docs: Sequence[BaseNode],
+        allow_update: bool = True,
+        batch_size: Optional[int] = None,
+        store_text: bool = True,
+    ) -> None:
+        await super().async_add_documents(
+            docs, allow_update=allow_update, batch_size=batch_size, store_text=store_text
+        )
+        self._index_nodes(docs)
+
+    def delete_document(self, doc_id: str, raise_error: bool = True) -> None:
+        super().delete_document(doc_id, raise_error=raise_error)
+        self._unindex_nodes([doc_id])
+
+    async def adelete_document(self, doc_id: str, raise_error: bool = True) -> None:
+        await super().adelete_document(doc_id, raise_error=raise_error)
+        self._unindex_nodes([doc_id])
+
+    def delete_ref_doc(self, ref_doc_id: str, raise_error: bool = True) -> None:
+        # Unindex all of the document's nodes in one pass before the per-node deletes
+        ref_doc_info = self.get_ref_doc_info(ref_doc_id)
+        if ref_doc_info is not None:
+            self._unindex_nodes(ref_doc_info.node_ids)
+        super().delete_ref_doc(ref_doc_id, raise_error=raise_error)
+
+    async def adelete_ref_doc(self, ref_doc_id: str, raise_error: bool = True) -> None:
+        ref_doc_info = await self.aget_ref_doc_info(ref_doc_id)
+        if ref_doc_info is not None:
+            self._unindex_nodes(ref_doc_info.node_ids)
+        await super().adelete_ref_doc(ref_doc_id, raise_error=raise_error)
+
+    def persist(self, persist_path: str = "", fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        self._kvstore.commit()
+
+    def rollback(self) -> None:
+        """Discard writes since the last persist."""
+        self._kvstore.rollback()
+
+    def close(self) -> None:
+        self._kvstore.close()
+
+    def abort(self) -> None:
+        self._kvstore.abort()
+
+
+class SqliteIndexStore(KVIndexStore):
+    """Index store on a `SqliteKVStore`; `persist` commits instead of rewriting a JSON file."""
+
+    def __init__(self, kvstore: SqliteKVStore, namespace: Optional[str] = None) -> None:
+        super().__init__(kvstore, namespace=namespace)
+
+    def add_index_struct(self, index_struct: IndexStruct) -> None:
+        # Loading an index re-adds the struct it was just read from; a read-only store already has it
+        if self._kvstore.read_only:
+            return
+        super().add_index_struct(index_struct)
+
+    def persist(self, persist_path: str = "", fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        self._kvstore.commit()
+
+
+def storage_exists(persist_dir: str) -> bool:
+    path = os.path.join(persist_dir, INDEX_DB_NAME)
+    if not os.path.exists(path) or not NumpyVectorStore.exists(persist_dir):
+        return False
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0] == STORAGE_VERSION
+    finally:
+        conn.close()
+
+
+def open_storage_context(
+    persist_dir: str, vector_store: NumpyVectorStore, read_only: bool = False
+) -> StorageContext:
+    """
+    Storage for an index in `persist_dir`: nodes and index structs in SQLite, vectors in `vector_store`.
+
+    Nothing is parsed up front; nodes are read from SQLite as queries need them.
+    `read_only` opens a published snapshot, which must not change while it is open.
+    """
+    kvstore = SqliteKVStore(
+        os.path.join(persist_dir, INDEX_DB_NAME),
+        schema=(*bm25.SCHEMA, *metadata_index.SCHEMA),
+        version=STORAGE_VERSION,
+        read_only=read_only,
+    )
+    return StorageContext.from_defaults(
+        docstore=SqliteDocumentStore(kvstore),
+        index_store=SqliteIndexStore(kvstore),
+        vector_store=vector_store,
+    )
+
+
+def load_index(persist_dir: str, vector_store: NumpyVectorStore, read_only: bool = False) -> BaseIndex:
+    storage_context = open_storage_context(persist_dir, vector_store, read_only=read_only)
+    index = load_index_from_storage(storage_context)
+    # Loading re-writes the index struct; commit it so this connection does not hold the write lock
+    storage_context.docstore.persist()
+    return index
+
+
+def copy_database(src_dir: str, dst_dir: str) -> None:
+    """Consistent copy of the SQLite file in `src_dir` to `dst_dir`, through SQLite's backup API."""
+    os.makedirs(dst_dir, exist_ok=True)
+    src = sqlite3.connect(os.path.join(src_dir, INDEX_DB_NAME))
+    dst = sqlite3.connect(os.path.join(dst_dir, INDEX_DB_NAME))
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
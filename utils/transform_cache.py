@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Sequence
+
+from llama_index.core.bridge.pydantic import PrivateAttr, SerializeAsAny
+from llama_index.core.schema import BaseNode, TransformComponent
+
+# Settings that change how a transformation is called, not what it returns
+_UNSTABLE_KEYS = {
+    "api_key",
+    "api_base",
+    "api_version",
+    "callback_manager",
+    "num_workers",
+    "show_progress",
+    "max_retries",
+    "timeout",
+    "reuse_client",
+    "default_headers",
+    "embed_batch_size",
+}
+
+
+def _scrub(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _scrub(v) for k, v in value.items() if k not in _UNSTABLE_KEYS}
+    if isinstance(value, list):
+        return [_scrub(v) for v in value]
+    return value
+
+
+def transformation_identity(transformation: TransformComponent) -> str:
+    """Stable fingerprint of a transformation: its class, prompts, and model settings."""
+    cls = type(transformation)
+    config = _scrub(transformation.to_dict())
+    payload = json.dumps(
+        {"class": f"{cls.__module__}.{cls.__qualname__}", "config": config},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class TransformationCache:
+    """
+    On-disk LRU cache of transformation outputs, backed by SQLite.
+
+    Entries are bounded by `max_entries`; the least recently read entries are evicted
+    first. `hits` and `misses` count nodes, not lookups.
+    """
+
+    def __init__(self, path: str = "cache/transformations.db", max_entries: int = 100_000) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        if not keys:
+            return found
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = list(keys[start : start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, last_access) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items.items()],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
+
+
+def _node_output(node: BaseNode) -> Dict[str, Any]:
+    return {
+        "metadata": node.metadata,
+        "excluded_embed_metadata_keys": node.excluded_embed_metadata_keys,
+        "excluded_llm_metadata_keys": node.excluded_llm_metadata_keys,
+        "embedding": node.embedding,
+    }
+
+
+def _apply_output(node: BaseNode, output: Dict[str, Any]) -> None:
+    node.metadata = output["metadata"]
+    node.excluded_embed_metadata_keys = output["excluded_embed_metadata_keys"]
+    node.excluded_llm_metadata_keys = output["excluded_llm_metadata_keys"]
+    node.embedding = output["embedding"]
+
+
+class CachedTransformation(TransformComponent):
+    """
+    Wraps a node-wise transformation (extractor or embedding) with a `TransformationCache`.
+
+    Nodes are grouped by source document, since document-level extractors such as
+    `TitleExtractor` read every node of a document at once. A group's key is the
+    transformation identity plus the content hash of each of its nodes; only groups
+    that miss are sent to the wrapped transformation.
+    """
+
+    transformation: SerializeAsAny[TransformComponent]
+    _cache: TransformationCache = PrivateAttr()
+    _identity: str = PrivateAttr()
+
+    def __init__(self, transformation: TransformComponent, cache: TransformationCache, **kwargs: Any) -> None:
+        super().__init__(transformation=transformation, **kwargs)
+        self._cache = cache
+        self._identity = transformation_identity(transformation)
+
+    def _group(self, nodes: Sequence[BaseNode]) -> Dict[str, List[BaseNode]]:
+        groups: Dict[str, List[BaseNode]] = {}
+        for node in nodes:
+            groups.setdefault(node.ref_doc_id or node.node_id, []).append(node)
+        keyed = {}
+        for group in groups.values():
+            digest = hashlib.sha256(self._identity.encode())
+            for node in group:
+                digest.update(node.hash.encode())
+            keyed[digest.hexdigest()] = group
+        return keyed
+
+    def _apply_hits(self, nodes: Sequence[BaseNode]) -> Dict[str, List[BaseNode]]:
+        groups = self._group(nodes)
+        cached = self._cache.get_many(list(groups))
+        misses = {}
+        for key, group in groups.items():
+            outputs = cached.get(key)
+            if outputs is None:
+                misses[key] = group
+                continue
+            for node, output in zip(group, outputs):
+                _apply_output(node, output)
+        miss_count = sum(len(group) for group in misses.values())
+        self._cache.hits += len(nodes) - miss_count
+        self._cache.misses += miss_count
+        return misses
+
+    def _store(
+        self,
+        nodes: Sequence[BaseNode],
+        misses: Dict[str, List[BaseNode]],
+        pending: List[BaseNode],
+        transformed: Sequence[BaseNode],
+    ) -> Sequence[BaseNode]:
+        if len(transformed) != len(pending):
+            logging.warning(
+                f"{type(self.transformation).__name__} changed the node count; results not cached"
+            )
+            pending_ids = {id(node) for node in pending}
+            return [node for node in nodes if id(node) not in pending_ids] + list(transformed)
+        items, position = {}, 0
+        for key, group in misses.items():
+            items[key] = [_node_output(node) for node in transformed[position : position + len(group)]]
+            position += len(group)
+        self._cache.put_many(items)
+        # Extractors may return copies instead of mutating in place
+        replaced = {id(old): new for old, new in zip(pending, transformed)}
+        return [replaced.get(id(node), node) for node in nodes]
+
+    def __call__(self, nodes: Sequence[BaseNode], **kwargs: Any) -> Sequence[BaseNode]:
+        misses = self._apply_hits(nodes)
+        if not misses:
+            return nodes
+        pending = [node for group in misses.values() for node in group]
+        return self._store(nodes, misses, pending, self.transformation(pending, **kwargs))
+
+    async def acall(self, nodes: Sequence[BaseNode], **kwargs: Any) -> Sequence[BaseNode]:
+        misses = self._apply_hits(nodes)
+        if not misses:
+            return nodes
+        pending = [node for group in misses.values() for node in group]
+        return self._store(nodes, misses, pending, await self.transformation.acall(pending, **kwargs))
@@ -0,0 +1,113 @@
+import asyncio
+import os
+from typing import List, Tuple
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
+from starlette.requests import Request
+
+# Allowance for the multipart framing around the file when checking Content-Length
+_MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+
+class UploadError(Exception):
+    """The request does not carry a usable file upload."""
+
+
+class UploadTooLarge(UploadError):
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(f"Upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+async def receive_file(request: Request, field: str, path: str, max_bytes: int) -> Tuple[str, int]:
+    """
+    Stream the file in multipart field `field` of `request` straight to `path`.
+
+    The body is parsed as it arrives, nothing is spooled first, and the upload
+    is refused as soon as it is known to exceed `max_bytes`: from Content-Length
+    before any of the body is read, otherwise at the first byte past the limit.
+    Returns the client's file name and the file size.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise UploadError("Expected a multipart/form-data body")
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            if int(content_length) > max_bytes + _MULTIPART_OVERHEAD_BYTES:
+                raise UploadTooLarge(max_bytes)
+        except ValueError:
+            raise UploadError("Invalid Content-Length")
+
+    header_field, header_value = bytearray(), bytearray()
+    headers = {}
+    state = {"in_file": False, "filename": None, "size": 0}
+    pending: List[bytes] = []
+
+    def on_part_begin() -> None:
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        _, disposition = parse_options_header(headers.get(b"content-disposition"))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if name == field and b"filename" in disposition and state["filename"] is None:
+            state["in_file"] = True
+            state["filename"] = disposition[b"filename"].decode("utf-8", "replace")
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        # Other fields are skipped rather than buffered
+        if state["in_file"]:
+            state["size"] += end - start
+            if state["size"] > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            pending.append(data[start:end])
+
+    def on_part_end() -> None:
+        state["in_file"] = False
+
+    parser = MultipartParser(
+        options[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    # Written to a .part file, so a half-received upload never looks complete
+    part = f"{path}.part"
+    try:
+        with open(part, "wb") as out:
+            async for chunk in request.stream():
+                try:
+                    parser.write(chunk)
+                except MultipartParseError as e:
+                    raise UploadError(f"Malformed multipart body: {str(e)}")
+                if pending:
+                    data = b"".join(pending)
+                    pending.clear()
+                    await asyncio.to_thread(out.write, data)
+            parser.finalize()
+        if state["filename"] is None:
+            raise UploadError(f"No file in field '{field}'")
+        os.replace(part, path)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return state["filename"], state["size"]
@@ -0,0 +1,488 @@
+import json
+import logging
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import fsspec
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+DEFAULT_NAMESPACE = "default"
+# StorageContext persists each vector store to `<namespace>__vector_store.json`; that
+# file holds a small header and the data files sit next to it
+PERSIST_SUFFIX = "__vector_store.json"
+PERSIST_FORMAT = "numpy-mmap-1"
+# Below this many rows brute force is as fast as probing IVF lists
+IVF_MIN_ROWS = 4096
+
+
+def _read_header(path: str) -> Optional[Dict[str, Any]]:
+    # Older storage keeps a full JSON vector store at the same path; never parse that
+    if not os.path.exists(path) or os.path.getsize(path) > 65536:
+        return None
+    with open(path) as f:
+        header = json.load(f)
+    return header if header.get("format") == PERSIST_FORMAT else None
+
+
+def _map(path: str, dtype: Any, shape: Tuple[int, ...]) -> np.ndarray:
+    if not np.prod(shape):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def _append_file(path: str, committed_bytes: int, data: bytes) -> None:
+    """Append after the last committed byte, dropping anything an interrupted persist left behind."""
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.truncate(committed_bytes)
+        f.seek(committed_bytes)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _replace_file(path: str, write: Any) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _RowLabels:
+    """
+    Node id and ref doc id of every matrix row.
+
+    Rows loaded from disk are decoded on demand from a memory-mapped blob, so
+    loading does not touch them; rows added since the last persist stay in memory.
+    """
+
+    def __init__(self, offsets: Optional[np.ndarray] = None, blob: Optional[np.ndarray] = None) -> None:
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.uint64)
+        self.blob = blob if blob is not None else np.zeros(0, dtype=np.uint8)
+        self.disk_count = len(self.offsets) - 1
+        self.pending: List[Tuple[str, str]] = []
+
+    def __len__(self) -> int:
+        return self.disk_count + len(self.pending)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def __getitem__(self, row: int) -> Tuple[str, str]:
+        if row >= self.disk_count:
+            return self.pending[row - self.disk_count]
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        node_id, ref_doc_id = bytes(self.blob[start:end]).decode().split("\x00")
+        return node_id, ref_doc_id
+
+    def append(self, node_id: str, ref_doc_id: str) -> None:
+        self.pending.append((node_id, ref_doc_id))
+
+    def encode_pending(self) -> Tuple[bytes, np.ndarray]:
+        """The pending rows as blob bytes plus their end offsets."""
+        encoded = [f"{node_id}\x00{ref_doc_id}".encode() for node_id, ref_doc_id in self.pending]
+        sizes = np.asarray([len(label) for label in encoded], dtype=np.uint64)
+        return b"".join(encoded), self.offsets[-1] + np.cumsum(sizes, dtype=np.uint64)
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store that keeps unit-normalized embeddings in one contiguous float32 matrix.
+
+    `exact` mode scores every live row with a single matrix-vector product.
+    `ivf` mode clusters rows with k-means into `nlist` inverted lists and only
+    scores the `nprobe` lists closest to the query; raise `nprobe` for recall,
+    lower it for latency. Small stores always use exact search.
+
+    On disk the matrix is a raw float32 file that is memory-mapped read-only on
+    load, so loading takes near-constant time and worker processes share the
+    pages through the page cache. A persist appends only the rows added since
+    the previous one; after a compaction it writes a new generation of files.
+
+    Args:
+        mode (str): `exact` or `ivf`
+        nlist (int): number of IVF lists; 0 picks 4 * sqrt(rows) at training time
+        nprobe (int): number of IVF lists scored per query
+    """
+
+    stores_text: bool = False
+    mode: str = Field(default="exact", description="Search mode: exact or ivf.")
+    nlist: int = Field(default=0, description="Number of IVF lists; 0 for automatic.")
+    nprobe: int = Field(default=8, description="Number of IVF lists scored per query.")
+
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _count: int = PrivateAttr(default=0)
+    _live: int = PrivateAttr(default=0)
+    _alive: Optional[np.ndarray] = PrivateAttr(default=None)
+    _labels: _RowLabels = PrivateAttr(default_factory=_RowLabels)
+    # Built on first use (writes and id-restricted queries), so plain searches never pay for it
+    _row_by_id: Optional[Dict[str, int]] = PrivateAttr(default=None)
+    _rows_by_ref_doc: Optional[Dict[str, List[int]]] = PrivateAttr(default=None)
+    _centroids: Optional[np.ndarray] = PrivateAttr(default=None)
+    _lists: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _trained_count: int = PrivateAttr(default=0)
+    # Files the matrix is mapped from; None until the first persist and after a compaction
+    _base_path: Optional[str] = PrivateAttr(default=None)
+    _generation: int = PrivateAttr(default=0)
+
+    def __init__(self, mode: str = "exact", nlist: int = 0, nprobe: int = 8, **kwargs: Any) -> None:
+        if mode not in ("exact", "ivf"):
+            raise ValueError("mode must be 'exact' or 'ivf'")
+        super().__init__(mode=mode, nlist=nlist, nprobe=nprobe, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __bool__(self) -> bool:
+        # StorageContext.from_defaults tests `if vector_store:`; an empty store must still count
+        return True
+
+    # -- writes -------------------------------------------------------------
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        if self._matrix is None:
+            capacity = max(1024, rows)
+            self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+            self._alive = np.zeros(capacity, dtype=bool)
+            return
+        if self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match store dimension {self._matrix.shape[1]}")
+        needed = self._count + rows
+        if needed > self._matrix.shape[0]:
+            # A matrix mapped from disk is read-only and exactly full, so the
+            # first insert after a load copies it into memory
+            capacity = max(needed, 2 * self._matrix.shape[0])
+            matrix = np.zeros((capacity, dim), dtype=np.float32)
+            matrix[: self._count] = self._matrix[: self._count]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[: self._count] = self._alive[: self._count]
+            self._matrix, self._alive = matrix, alive
+
+    def _lookup(self) -> Tuple[Dict[str, int], Dict[str, List[int]]]:
+        if self._row_by_id is None:
+            row_by_id: Dict[str, int] = {}
+            rows_by_ref_doc: Dict[str, List[int]] = {}
+            for row, (node_id, ref_doc_id) in enumerate(self._labels):
+                rows_by_ref_doc.setdefault(ref_doc_id, []).append(row)
+                if self._alive[row]:
+                    row_by_id[node_id] = row
+            self._row_by_id, self._rows_by_ref_doc = row_by_id, rows_by_ref_doc
+        return self._row_by_id, self._rows_by_ref_doc
+
+    def build_lookup(self) -> None:
+        """Build the node id map now, off the hot path, rather than on the first id-restricted query."""
+        self._lookup()
+
+    def _append(self, ids: List[str], ref_doc_ids: List[str], embeddings: np.ndarray) -> None:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embeddings = embeddings / norms
+        self._reserve(len(ids), embeddings.shape[1])
+        row_by_id, rows_by_ref_doc = self._lookup()
+        start = self._count
+        for offset, (node_id, ref_doc_id) in enumerate(zip(ids, ref_doc_ids)):
+            if node_id in row_by_id:
+                self._kill(row_by_id[node_id])
+            row = start + offset
+            self._labels.append(node_id, ref_doc_id)
+            row_by_id[node_id] = row
+            rows_by_ref_doc.setdefault(ref_doc_id, []).append(row)
+        self._matrix[start : start + len(ids)] = embeddings
+        self._alive[start : start + len(ids)] = True
+        self._count += len(ids)
+        self._live += len(ids)
+        if self.mode == "ivf" and len(self) >= IVF_MIN_ROWS and (
+            self._centroids is None or len(self) > 2 * self._trained_count
+        ):
+            # Train on the writer's thread (ingestion or load) so queries never pay for it
+            self._train()
+        elif self._centroids is not None:
+            self._assign(np.arange(start, self._count))
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        embeddings = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        self._append(
+            [node.node_id for node in nodes],
+            [node.ref_doc_id or "None" for node in nodes],
+            embeddings,
+        )
+        return [node.node_id for node in nodes]
+
+    def _kill(self, row: int) -> None:
+        self._alive[row] = False
+        self._live -= 1
+        self._lookup()[0].pop(self._labels[row][0], None)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for row in self._lookup()[1].pop(ref_doc_id, []):
+            if self._alive[row]:
+                self._kill(row)
+        self._maybe_compact()
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        if filters is not None:
+            raise NotImplementedError("NumpyVectorStore does not support metadata filters")
+        row_by_id = self._lookup()[0]
+        for node_id in node_ids or []:
+            row = row_by_id.get(node_id)
+            if row is not None:
+                self._kill(row)
+        self._maybe_compact()
+
+    def clear(self) -> None:
+        self._matrix = None
+        self._alive = None
+        self._count = 0
+        self._live = 0
+        self._labels = _RowLabels()
+        self._row_by_id, self._rows_by_ref_doc = {}, {}
+        self._base_path = None
+        self._reset_ivf()
+
+    def _maybe_compact(self) -> None:
+        """Drop deleted rows once they are more than a third of the matrix."""
+        dead = self._count - self._live
+        if dead < 1024 or dead * 3 < self._count:
+            return
+        rows = np.nonzero(self._alive[: self._count])[0]
+        labels = [self._labels[row] for row in rows.tolist()]
+        embeddings = np.array(self._matrix[rows])
+        self.clear()
+        self._append([node_id for node_id, _ in labels], [ref_doc_id for _, ref_doc_id in labels], embeddings)
+        logging.debug(f"Compacted vector store to {len(labels)} rows")
+
+    # -- IVF ----------------------------------------------------------------
+
+    def _reset_ivf(self) -> None:
+        self._centroids = None
+        self._lists = []
+        self._trained_count = 0
+
+    def _assign(self, rows: np.ndarray) -> None:
+        for start in range(0, len(rows), 65536):
+            chunk = rows[start : start + 65536]
+            nearest = np.argmax(self._matrix[chunk] @ self._centroids.T, axis=1)
+            order = np.argsort(nearest, kind="stable")
+            list_ids, starts = np.unique(nearest[order], return_index=True)
+            for list_id, members in zip(list_ids.tolist(), np.split(chunk[order], starts[1:])):
+                self._lists[list_id] = np.concatenate([self._lists[list_id], members])
+
+    def _train(self, iterations: int = 10, seed: int = 0) -> None:
+        live = np.nonzero(self._alive[: self._count])[0]
+        nlist = self.nlist or int(4 * np.sqrt(len(live)))
+        nlist = max(1, min(nlist, len(live)))
+        rng = np.random.default_rng(seed)
+        sample = self._matrix[rng.choice(live, size=min(len(live), nlist * 32), replace=False)]
+        columns = np.ascontiguousarray(sample.T)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            # Sum members per list one dimension at a time; empty lists keep their old centroid
+            sums = np.stack(
+                [np.bincount(assignment, weights=column, minlength=nlist) for column in columns], axis=1
+            )
+            list_ids = np.nonzero(np.bincount(assignment, minlength=nlist))[0]
+            sums = sums[list_ids]
+            centroids[list_ids] = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(min=1e-12)
+        self._centroids = centroids
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._assign(live)
+        self._trained_count = len(live)
+        logging.info(f"Trained IVF with {nlist} lists over {len(live)} vectors")
+
+    def _ivf_candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self._centroids is None or len(self) < IVF_MIN_ROWS:
+            return None
+        nprobe = min(self.nprobe, len(self._lists))
+        probe = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self._lists[list_id] for list_id in probe.tolist()])
+
+    # -- reads --------------------------------------------------------------
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("NumpyVectorStore does not support metadata filters")
+        if self._matrix is None or query.query_embedding is None or not len(self):
+            return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+        vector = np.asarray(query.query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+
+        if query.node_ids is not None or query.doc_ids is not None:
+            row_by_id, rows_by_ref_doc = self._lookup()
+            rows = set()
+            for node_id in query.node_ids or []:
+                if node_id in row_by_id:
+                    rows.add(row_by_id[node_id])
+            for ref_doc_id in query.doc_ids or []:
+                rows.update(rows_by_ref_doc.get(ref_doc_id, []))
+            candidates = np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+        else:
+            candidates = self._ivf_candidates(vector)
+
+        if candidates is None:
+            scores = self._matrix[: self._count] @ vector
+            scores[~self._alive[: self._count]] = -np.inf
+            rows = np.arange(self._count)
+        else:
+            candidates = candidates[self._alive[candidates]]
+            scores = self._matrix[candidates] @ vector
+            rows = candidates
+
+        top_k = min(query.similarity_top_k, int(np.isfinite(scores).sum()))
+        if top_k <= 0:
+            return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            nodes=None,
+            similarities=scores[top].tolist(),
+            ids=[self._labels[row][0] for row in rows[top].tolist()],
+        )
+
+    # -- persistence --------------------------------------------------------
+
+    @staticmethod
+    def _files(base_path: str, generation: int) -> Dict[str, str]:
+        return {
+            "matrix": f"{base_path}.{generation}.f32",
+            "labels": f"{base_path}.{generation}.labels",
+            "offsets": f"{base_path}.{generation}.offsets",
+            "alive": f"{base_path}.alive",
+            "ivf": f"{base_path}.ivf.npz",
+        }
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        """
+        Write the header to `persist_path` and the data files next to it.
+
+        The header is replaced last, so an interrupted persist leaves the previous
+        state readable; bytes past the committed row count are ignored and overwritten.
+        """
+        base_path = os.path.splitext(persist_path)[0]
+        os.makedirs(os.path.dirname(base_path) or ".", exist_ok=True)
+        header = _read_header(persist_path)
+        dim = self._matrix.shape[1] if self._matrix is not None else 0
+
+        if (
+            header is not None
+            and self._base_path == base_path
+            and header["generation"] == self._generation
+            and header["count"] == self._labels.disk_count
+        ):
+            generation, start = self._generation, self._labels.disk_count
+        else:
+            # First persist here, or compacted since: write every row to a new generation
+            generation = header["generation"] + 1 if header is not None else 0
+            start = 0
+            if self._labels.disk_count:
+                labels = _RowLabels()
+                labels.pending = list(self._labels)
+                self._labels = labels
+        files = self._files(base_path, generation)
+
+        blob, ends = self._labels.encode_pending()
+        if start == 0:
+            ends = np.concatenate([np.zeros(1, dtype=np.uint64), ends])
+        rows = np.ascontiguousarray(self._matrix[start : self._count]) if dim else np.zeros(0, dtype=np.float32)
+        _append_file(files["matrix"], start * dim * 4, rows.tobytes())
+        _append_file(files["labels"], int(self._labels.offsets[-1]) if start else 0, blob)
+        _append_file(files["offsets"], (start + 1) * 8 if start else 0, ends.tobytes())
+        alive = self._alive[: self._count] if self._alive is not None else np.zeros(0, dtype=bool)
+        _replace_file(files["alive"], lambda f: f.write(alive.astype(np.uint8).tobytes()))
+        if self._centroids is not None:
+            assignment = np.full(self._count, -1, dtype=np.int32)
+            for list_id, members in enumerate(self._lists):
+                assignment[members] = list_id
+            _replace_file(
+                files["ivf"],
+                lambda f: np.savez(
+                    f, centroids=self._centroids, assignment=assignment, trained_count=self._trained_count
+                ),
+            )
+        elif os.path.exists(files["ivf"]):
+            os.remove(files["ivf"])
+
+        new_header = {"format": PERSIST_FORMAT, "generation": generation, "count": self._count, "dim": dim}
+        _replace_file(persist_path, lambda f: f.write(json.dumps(new_header).encode()))
+        if header is not None and header["generation"] != generation:
+            # Processes that still map the old generation keep reading it until they reload
+            for path in self._files(base_path, header["generation"]).values():
+                if path not in files.values() and os.path.exists(path):
+                    os.remove(path)
+
+        logging.debug(f"Persisted {self._count - start} new vector rows to {base_path} (generation {generation})")
+        self._map(base_path, new_header)
+
+    def _map(self, base_path: str, header: Dict[str, Any]) -> None:
+        """Point the store at the files described by `header`, memory-mapping the matrix and labels."""
+        count, dim, generation = header["count"], header["dim"], header["generation"]
+        files = self._files(base_path, generation)
+        self._matrix = _map(files["matrix"], np.float32, (count, dim)) if dim else None
+        offsets = _map(files["offsets"], np.uint64, (count + 1,)) if count else None
+        blob = _map(files["labels"], np.uint8, (int(offsets[-1]),)) if count else None
+        self._labels = _RowLabels(offsets, blob)
+        self._alive = np.fromfile(files["alive"], dtype=np.uint8, count=count).astype(bool)
+        self._count = count
+        self._live = int(self._alive.sum())
+        self._row_by_id = self._rows_by_ref_doc = None
+        self._reset_ivf()
+        if self.mode == "ivf" and os.path.exists(files["ivf"]):
+            with np.load(files["ivf"]) as ivf:
+                self._centroids = ivf["centroids"]
+                self._trained_count = int(ivf["trained_count"])
+                assignment = ivf["assignment"][:count]
+            rows = np.nonzero(assignment >= 0)[0]
+            order = np.argsort(assignment[rows], kind="stable")
+            bounds = np.searchsorted(assignment[rows][order], np.arange(1, len(self._centroids)))
+            self._lists = np.split(rows[order], bounds)
+        self._base_path, self._generation = base_path, generation
+
+    @staticmethod
+    def persist_path(persist_dir: str, namespace: str = DEFAULT_NAMESPACE) -> str:
+        return os.path.join(persist_dir, f"{namespace}{PERSIST_SUFFIX}")
+
+    @classmethod
+    def exists(cls, persist_dir: str, namespace: str = DEFAULT_NAMESPACE) -> bool:
+        return _read_header(cls.persist_path(persist_dir, namespace)) is not None
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: str, namespace: str = DEFAULT_NAMESPACE, **kwargs: Any
+    ) -> "NumpyVectorStore":
+        path = cls.persist_path(persist_dir, namespace)
+        header = _read_header(path)
+        if header is None:
+            raise FileNotFoundError(f"No vector store at {path}")
+        store = cls(**kwargs)
+        store._map(os.path.splitext(path)[0], header)
+        if store.mode == "ivf" and store._centroids is None and len(store) >= IVF_MIN_ROWS:
+            store._train()
+        return store
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from utils import metrics
+
+# A failed warm-up (say, the index could not be built) is retried after this many seconds
+WARMUP_RETRY_INTERVAL = float(os.getenv('WARMUP_RETRY_INTERVAL', '30'))
+
+
+class Warmup:
+    """
+    Start-up work that runs in the background once the server is accepting connections.
+
+    Until it succeeds the worker is live but not ready: readiness probes get a
+    503 and requests that need it can `wait()` for it with a timeout. A
+    failed attempt is logged and retried every `retry_interval` seconds.
+    """
+
+    def __init__(self, retry_interval: float = 30.0) -> None:
+        self.retry_interval = retry_interval
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.startup_seconds: Optional[float] = None
+        self._started_at = time.monotonic()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def status(self) -> Dict[str, object]:
+        return {"status": self.state, "error": self.error, "startup_seconds": self.startup_seconds}
+
+    async def start(self, work: Callable[[], Awaitable[None]]) -> None:
+        if self._task is None:
+            self.state = "starting"
+            self.error = None
+            self._started_at = time.monotonic()
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run(work))
+
+    async def _run(self, work: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            try:
+                await work()
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                logging.error(f"Warm-up failed, retrying in {self.retry_interval}s: {str(e)}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            self.state = "ready"
+            self.error = None
+            self.startup_seconds = round(time.monotonic() - self._started_at, 3)
+            self._ready.set()
+            logging.info(f"Ready to serve after {self.startup_seconds}s of warm-up")
+            return
+
+    async def wait(self, timeout: float) -> bool:
+        """True once ready; waits at most `timeout` seconds (0 only checks)."""
+        if self.ready or timeout <= 0:
+            return self.ready
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.ready
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+warmup = Warmup(retry_interval=WARMUP_RETRY_INTERVAL)
+metrics.gauge("app_ready", "1 once start-up warm-up has finished on this worker.", lambda: {(): int(warmup.ready)})